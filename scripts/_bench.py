@@ -0,0 +1,50 @@
+"""Shared setup for the benchmark scripts in this directory.
+
+Importing this module puts src/ on sys.path and points DB_PATH and
+TTS_CACHE_DIR at a scratch directory, so the module-level singletons never
+touch data/ or cache/. Import it before any bot module.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"
+)
+sys.path.insert(0, SRC_DIR)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="bench-")
+os.environ["DB_PATH"] = os.path.join(SCRATCH_DIR, "anon_bot.db")
+os.environ["TTS_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "tts")
+
+
+def scratch_path(name: str) -> str:
+    return os.path.join(SCRATCH_DIR, name)
+
+
+def per_call_us(fn, calls: int) -> float:
+    """Mean wall time of fn(i) for i in range(calls), in microseconds."""
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def per_call_us_async(fn, calls: int) -> float:
+    """Mean wall time of `await fn(i)` for i in range(calls), in microseconds."""
+    start = time.perf_counter()
+    for i in range(calls):
+        await fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def report(title: str, rows, columns=("before", "after")):
+    """Print (name, before_us, after_us) rows as an aligned table."""
+    print(title)
+    width = max(len(name) for name, *_ in rows)
+    print(f"  {'':{width}}  " + "  ".join(f"{c:>10}" for c in columns))
+    for name, *values in rows:
+        cells = "  ".join(f"{v:>7.0f} us" for v in values)
+        print(f"  {name:{width}}  {cells}")
@@ -0,0 +1,47 @@
+"""Link writes for forwarded 10-item albums through AsyncDatabase: one
+save_message_link call per item versus one save_message_links bulk insert.
+
+    python scripts/bench_album_links.py [albums] [items]
+"""
+
+import asyncio
+import sys
+
+from _bench import per_call_us_async, report, scratch_path
+
+from database import AsyncDatabase, Database
+
+
+def album_links(album: int, items: int):
+    base = album * items
+    return [(base + i, 2, 1, base + i, 1, "№001") for i in range(items)]
+
+
+async def main(albums: int = 300, items: int = 10):
+    database = Database(scratch_path("albums.db"))
+    adb = AsyncDatabase(database)
+
+    async def one_by_one(album: int):
+        for link in album_links(album, items):
+            await adb.save_message_link(*link)
+
+    async def bulk(album: int):
+        await adb.save_message_links(album_links(albums + album, items))
+
+    report(
+        f"Link writes per {items}-item album, {albums} albums",
+        [
+            (
+                "message_links",
+                await per_call_us_async(one_by_one, albums),
+                await per_call_us_async(bulk, albums),
+            )
+        ],
+        columns=("per item", "bulk"),
+    )
+    adb.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,66 @@
+"""Anonymous number allocation for one receiver with 10k senders.
+
+Seeds the senders one by one, then lets concurrent first messages from new
+senders allocate through two Database instances on the same file (like two
+bot processes) and checks that no number was issued twice.
+
+    python scripts/bench_anon_num.py [senders] [new_senders] [threads]
+"""
+
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _bench import per_call_us, scratch_path
+
+from database import Database
+
+RECEIVER_ID = 1
+
+
+def duplicates(database: Database) -> list:
+    with database._read_connection() as conn:
+        return conn.execute(
+            "SELECT anon_num, COUNT(*) FROM anon_identities WHERE receiver_id = ? GROUP BY anon_num HAVING COUNT(*) > 1",
+            (RECEIVER_ID,),
+        ).fetchall()
+
+
+def main(senders: int = 10000, new_senders: int = 2000, threads: int = 16):
+    path = scratch_path("anon.db")
+    first, second = Database(path), Database(path)
+
+    seed_us = per_call_us(
+        lambda i: first.get_or_create_anon_num(RECEIVER_ID, 1000 + i), senders
+    )
+    print(f"Seeding {senders} senders: {seed_us:.0f} us per allocation")
+
+    def first_message(sender_id: int) -> float:
+        database = first if sender_id % 2 else second
+        start = time.perf_counter()
+        database.get_or_create_anon_num(RECEIVER_ID, sender_id)
+        return (time.perf_counter() - start) * 1e6
+
+    new_ids = range(1000 + senders, 1000 + senders + new_senders)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = sorted(pool.map(first_message, new_ids))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{new_senders} concurrent first messages on {threads} threads: "
+        f"{new_senders / elapsed:.0f}/s, "
+        f"p50 {statistics.median(latencies):.0f} us, "
+        f"p99 {latencies[int(len(latencies) * 0.99)]:.0f} us"
+    )
+
+    dupes = duplicates(first)
+    assert not dupes, f"duplicate anon numbers issued: {dupes[:10]}"
+    print(f"{senders + new_senders} senders, no duplicate numbers")
+    first.close()
+    second.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
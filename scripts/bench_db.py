@@ -0,0 +1,72 @@
+"""Per-call latency of hot Database methods: a fresh connection per call
+(how the bot worked before pooling: rollback journal, default pragmas)
+versus the pooled writer and readers with WAL tuning.
+
+The settings cache is disabled on both sides so get_user_settings always
+reads the database.
+
+    python scripts/bench_db.py [calls]
+"""
+
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+from _bench import per_call_us, report, scratch_path
+
+from cache import LRUCache
+from database import Database
+
+
+class FreshConnectionDatabase(Database):
+    """Database opening and closing a default connection on every call."""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self._writer.close()
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    @contextmanager
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    _read_connection = _get_connection
+
+    def close(self):
+        pass
+
+
+def run(database: Database, calls: int) -> dict:
+    database.settings_cache = LRUCache(ttl=0)
+    for user_id in range(100):
+        database.update_user_settings(user_id, lang="en")
+    return {
+        "get_user_settings": per_call_us(
+            lambda i: database.get_user_settings(i % 100), calls
+        ),
+        "save_message_link": per_call_us(
+            lambda i: database.save_message_link(i, 1, 2, i, 2, "№001"), calls
+        ),
+    }
+
+
+def main(calls: int = 2000):
+    before = run(FreshConnectionDatabase(scratch_path("fresh.db")), calls)
+    pooled = Database(scratch_path("pooled.db"))
+    after = run(pooled, calls)
+    pooled.close()
+    report(
+        f"Per-call latency, {calls} calls",
+        [(name, before[name], after[name]) for name in before],
+        columns=("fresh", "pooled"),
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
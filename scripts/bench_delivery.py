@@ -0,0 +1,71 @@
+"""Per-message DB time of the delivery decisions in handle_forwarding: the
+separate lookups it used to make (both languages, target settings, block
+status, anon number) versus one get_delivery_context call, through
+AsyncDatabase with a warm and a cold settings cache.
+
+    python scripts/bench_delivery.py [messages]
+"""
+
+import asyncio
+import sys
+
+from _bench import per_call_us_async, report, scratch_path
+
+from cache import LRUCache
+from database import AsyncDatabase, Database
+
+USERS = 500
+
+
+async def separate_calls(adb: AsyncDatabase, target_id: int, sender_id: int):
+    target_lang = await adb.get_user_lang(target_id, None) or "uk"
+    sender_lang = await adb.get_user_lang(sender_id, None) or "uk"
+    settings = await adb.get_user_settings(target_id)
+    blocked = await adb.is_blocked(target_id, sender_id)
+    anon_num = await adb.get_or_create_anon_num(target_id, sender_id)
+    return settings, target_lang, sender_lang, blocked, anon_num
+
+
+async def delivery_context(adb: AsyncDatabase, target_id: int, sender_id: int):
+    ctx = await adb.get_delivery_context(target_id, sender_id)
+    anon_num = ctx.anon_num or await adb.get_or_create_anon_num(target_id, sender_id)
+    return ctx, anon_num
+
+
+def seed(database: Database):
+    for user_id in range(USERS):
+        database.update_user_settings(user_id, lang="en" if user_id % 2 else "uk")
+        database.get_or_create_anon_num(user_id, (user_id + 1) % USERS)
+        if user_id % 10 == 0:
+            database.block_user(user_id, (user_id + 1) % USERS)
+
+
+async def main(messages: int = 3000):
+    database = Database(scratch_path("delivery.db"))
+    seed(database)
+    adb = AsyncDatabase(database)
+
+    def message(path):
+        return lambda i: path(adb, i % USERS, (i % USERS + 1) % USERS)
+
+    rows = []
+    for label, cache in (
+        ("warm cache", LRUCache()),
+        ("cold cache", LRUCache(ttl=0)),
+    ):
+        database.settings_cache = cache
+        before = await per_call_us_async(message(separate_calls), messages)
+        after = await per_call_us_async(message(delivery_context), messages)
+        rows.append((label, before, after))
+
+    report(
+        f"Per-message DB time, {messages} messages",
+        rows,
+        columns=("separate", "context"),
+    )
+    adb.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:])))
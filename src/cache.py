@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with a TTL and hit-rate metrics."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; read-through loads note it before
+        # reading so a result that raced an invalidation of its key is dropped
+        self.generation = 0
+        # key -> generation of its last invalidation, for the most recent
+        # `maxsize` invalidations; older ones are folded into _stale_before
+        self._invalidated = OrderedDict()
+        self._stale_before = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return a cached value, or `default` if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation: int = None):
+        """Store a value. If `generation` is given and the key was invalidated
+        since it was read, the value is considered stale and not stored."""
+        with self._lock:
+            if generation is not None and (
+                generation < self._stale_before
+                or generation < self._invalidated.get(key, 0)
+            ):
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single key."""
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+            self._invalidated[key] = self.generation
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.maxsize:
+                _, stamp = self._invalidated.popitem(last=False)
+                self._stale_before = max(self._stale_before, stamp)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._invalidated.clear()
+            self._stale_before = self.generation
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -11,8 +11,89 @@ if not ADMIN_IDS and os.getenv("ADMIN_ID"):
     ADMIN_IDS = [int(os.getenv("ADMIN_ID"))]
 REPORT_CHAT_ID = int(os.getenv("REPORT_CHAT_ID", 0))
 REPORT_THREAD_ID = int(os.getenv("REPORT_THREAD_ID", 0))
-DB_PATH = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "anon_bot.db"
+DB_PATH = os.getenv(
+    "DB_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "data",
+        "anon_bot.db",
+    ),
 )
 AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
 AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
+# Size of the pooled read-only SQLite connection set
+DB_READERS = int(os.getenv("DB_READERS", 4))
+# Write-behind for message links and session touches: flush interval in ms
+# (0 disables it) and the number of queued rows that triggers an early flush
+DB_WRITE_BEHIND_MS = int(os.getenv("DB_WRITE_BEHIND_MS", 0))
+DB_WRITE_BEHIND_MAX_ROWS = int(os.getenv("DB_WRITE_BEHIND_MAX_ROWS", 256))
+# In-process cache for user settings: max entries and TTL in seconds
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", 10000))
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", 300))
+# Retention: how often to prune (seconds), rows per transaction, and how many
+# days to keep each kind of row (0 keeps rows forever). Message links older
+# than the reply window are moved to ARCHIVE_DB_PATH instead of deleted,
+# except the newest link of each dialogue direction.
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 3600))
+RETENTION_CHUNK = int(os.getenv("RETENTION_CHUNK", 500))
+RETENTION_LINK_DAYS = int(os.getenv("RETENTION_LINK_DAYS", 30))
+RETENTION_COOLDOWN_DAYS = int(os.getenv("RETENTION_COOLDOWN_DAYS", 1))
+RETENTION_IDENTITY_DAYS = int(os.getenv("RETENTION_IDENTITY_DAYS", 90))
+RETENTION_FILE_ID_DAYS = int(os.getenv("RETENTION_FILE_ID_DAYS", 7))
+RETENTION_BLOCK_DAYS = int(os.getenv("RETENTION_BLOCK_DAYS", 0))
+ARCHIVE_DB_PATH = os.getenv(
+    "ARCHIVE_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "archive.db")
+)
+# In-memory rate limits on top of the admin cooldown (0 disables a limit)
+# and how often pair cooldowns are snapshotted to the database (seconds)
+RATE_LIMIT_SENDER_PER_MIN = int(os.getenv("RATE_LIMIT_SENDER_PER_MIN", 0))
+RATE_LIMIT_GLOBAL_PER_SEC = int(os.getenv("RATE_LIMIT_GLOBAL_PER_SEC", 0))
+RATE_LIMIT_SNAPSHOT_INTERVAL = int(os.getenv("RATE_LIMIT_SNAPSHOT_INTERVAL", 60))
+# How often usage counters are written to the database (seconds)
+COUNTERS_FLUSH_INTERVAL = int(os.getenv("COUNTERS_FLUSH_INTERVAL", 10))
+# Outbound Bot API shaping: messages per second and burst per chat, global
+# messages per second, and the number of requests in flight at once
+SEND_PER_CHAT_RATE = float(os.getenv("SEND_PER_CHAT_RATE", 1))
+SEND_PER_CHAT_BURST = float(os.getenv("SEND_PER_CHAT_BURST", 3))
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_MAX_IN_FLIGHT = int(os.getenv("SEND_MAX_IN_FLIGHT", 16))
+# Recipients fetched and sent per broadcast page; progress is saved per page
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", 100))
+# FSM storage: records kept in memory, how long changes are batched before
+# being written (ms), and the minimum lifetime of an idle record (seconds;
+# the effective TTL is the larger of this and session_time)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))
+FSM_FLUSH_MS = int(os.getenv("FSM_FLUSH_MS", 500))
+FSM_TTL_FLOOR = int(os.getenv("FSM_TTL_FLOOR", 3600))
+# Webhook mode (polling is used when WEBHOOK_URL is empty): public base URL,
+# path, secret token checked on every request (random per run if empty) and
+# listen address
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+# Workers processing updates (in order per user) and how many updates may
+# wait before the webhook answers 503
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+# Reaction changes on one message within this window (ms) are delivered
+# to the sender as one notification (0 delivers every change)
+REACTION_DEBOUNCE_MS = int(os.getenv("REACTION_DEBOUNCE_MS", 1500))
+# Directory and disk budget of the synthesized speech cache (MB), and how
+# long a clip handed out from it is protected from eviction (seconds)
+TTS_CACHE_DIR = os.getenv(
+    "TTS_CACHE_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "tts"
+    ),
+)
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", 200))
+TTS_CACHE_GRACE = int(os.getenv("TTS_CACHE_GRACE", 900))
+# Speech backends in order of preference ("azure", "edge"; "stub" writes
+# silence for offline runs), per-call timeout (seconds), and the circuit
+# breaker: failures in a row that take a backend out and for how long
+TTS_PROVIDERS = os.getenv("TTS_PROVIDERS", "azure,edge")
+TTS_PROVIDER_TIMEOUT = float(os.getenv("TTS_PROVIDER_TIMEOUT", 20))
+TTS_BREAKER_FAILURES = int(os.getenv("TTS_BREAKER_FAILURES", 3))
+TTS_BREAKER_COOLDOWN = float(os.getenv("TTS_BREAKER_COOLDOWN", 60))
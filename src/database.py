@@ -1,151 +1,709 @@
+import asyncio
+import functools
+import logging
 import sqlite3
 import random
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from config import DB_PATH
+from typing import NamedTuple, Optional
+from config import (
+    DB_PATH,
+    ARCHIVE_DB_PATH,
+    DB_READERS,
+    DB_WRITE_BEHIND_MS,
+    DB_WRITE_BEHIND_MAX_ROWS,
+    SETTINGS_CACHE_SIZE,
+    SETTINGS_CACHE_TTL,
+)
+from cache import LRUCache
+
+# Database-wide settings, persisted in the file itself
+DB_PRAGMAS = ("PRAGMA journal_mode=WAL",)
+
+# Per-connection tuning, applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+SAVE_LINK_SQL = """INSERT OR REPLACE INTO message_links
+    (receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, sender_chat_id, anon_num, poll_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+UPSERT_SESSION_SQL = "INSERT INTO active_sessions (user_a, user_b, anon_num, updated_at) VALUES (?, ?, ?, ?) ON CONFLICT(user_a, user_b) DO UPDATE SET anon_num = excluded.anon_num, updated_at = excluded.updated_at"
+TOUCH_SESSION_SQL = (
+    "UPDATE active_sessions SET updated_at = ? WHERE user_a = ? AND user_b = ?"
+)
+# Keeps both identities of a pair in a live dialogue from expiring (retention
+# and number recycling go by updated_at); at most one write per pair a day
+TOUCH_IDENTITIES_SQL = """UPDATE anon_identities SET updated_at = ?1
+    WHERE ((sender_id = ?2 AND receiver_id = ?3) OR (sender_id = ?3 AND receiver_id = ?2))
+    AND updated_at < datetime(?1, '-1 day')"""
+
+
+class UserSettings:
+    """Read-only snapshot of a user_settings row.
+
+    Supports dict-style reads (`settings["auto_voice"]`, `settings.get(...)`)
+    so it can be passed wherever a settings dict was used before.
+    """
+
+    FIELDS = (
+        "user_id",
+        "lang",
+        "receive_media",
+        "receive_messages",
+        "auto_voice",
+        "voice_gender",
+        "anon_audio",
+        "skip_confirm_voice",
+        "skip_confirm_media",
+    )
+    __slots__ = FIELDS + ("persisted",)
+
+    def __init__(
+        self,
+        user_id,
+        lang="uk",
+        receive_media=1,
+        receive_messages=1,
+        auto_voice=0,
+        voice_gender="rnd",
+        anon_audio=1,
+        skip_confirm_voice=0,
+        skip_confirm_media=0,
+        persisted=False,
+    ):
+        self.user_id = user_id
+        self.lang = lang
+        self.receive_media = receive_media
+        self.receive_messages = receive_messages
+        self.auto_voice = auto_voice
+        self.voice_gender = voice_gender
+        self.anon_audio = anon_audio
+        self.skip_confirm_voice = skip_confirm_voice
+        self.skip_confirm_media = skip_confirm_media
+        # False when the user has no row yet and these are the defaults
+        self.persisted = persisted
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"UserSettings({self.as_dict()!r})"
+
+
+class DeliveryContext(NamedTuple):
+    """Everything needed to decide on one sender -> target delivery."""
+
+    target_settings: UserSettings
+    target_lang: str
+    sender_lang: str
+    is_blocked: bool
+    # Existing anonymous number of the sender for this target, if any
+    anon_num: Optional[str]
+
+
+# Anonymous number ranges tried in order, random probes per range, and how
+# long a number stays reserved for its sender
+ANON_NUM_RANGES = ((1, 999), (1000, 9999), (10000, 99999))
+ANON_NUM_PROBES = 16
+ANON_NUM_RECYCLE_DAYS = 30
+
+
+def _parse_flag(value: str) -> bool:
+    return value == "1"
+
+
+# Typed global_config keys: key -> (parser, default)
+CONFIG_SCHEMA = {
+    "message_cooldown": (int, 0),
+    "session_time": (int, 5),
+    "auto_dialogue": (_parse_flag, True),
+}
+
+
+class GlobalConfig:
+    """In-memory registry of global_config.
+
+    Loaded once at startup and kept current by Database.set_global_config,
+    so reads cost no I/O. Keys listed in CONFIG_SCHEMA are parsed once, when
+    they are loaded or changed. Callbacks registered with subscribe() are
+    called with the new parsed value whenever a key changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = {}
+        self._values = {}
+        self._subscribers = {}
+
+    def _parse(self, key: str, raw):
+        parser, default = CONFIG_SCHEMA.get(key, (None, None))
+        if parser is None:
+            return raw
+        if raw is None:
+            return default
+        try:
+            return parser(raw)
+        except (ValueError, TypeError):
+            logging.warning(f"Invalid value for config {key}: {raw!r}")
+            return default
+
+    def load(self, rows):
+        """Replace the registry contents with (key, value) rows."""
+        with self._lock:
+            self._raw = dict(rows)
+            self._values = {
+                key: self._parse(key, raw) for key, raw in self._raw.items()
+            }
+
+    def update(self, key: str, raw: str):
+        """Store a new raw value and notify subscribers."""
+        value = self._parse(key, raw)
+        with self._lock:
+            self._raw[key] = raw
+            self._values[key] = value
+            callbacks = list(self._subscribers.get(key, ()))
+        for callback in callbacks:
+            try:
+                callback(value)
+            except Exception as e:
+                logging.error(f"Config subscriber for {key} failed: {e}")
+
+    def get(self, key: str, default=None):
+        """Parsed value of a key; schema keys fall back to their typed default."""
+        if key in self._values:
+            return self._values[key]
+        if key in CONFIG_SCHEMA:
+            return CONFIG_SCHEMA[key][1]
+        return default
+
+    def raw(self, key: str, default=None):
+        """Value exactly as stored in global_config."""
+        return self._raw.get(key, default)
+
+    def subscribe(self, key: str, callback):
+        """Call `callback(value)` every time `key` changes."""
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(callback)
+
+
+def _utc_now() -> str:
+    """Current time in SQLite's CURRENT_TIMESTAMP format."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
 
 
 class Database:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(
+        self,
+        db_path=DB_PATH,
+        readers: int = DB_READERS,
+        write_behind_ms: int = DB_WRITE_BEHIND_MS,
+        write_behind_rows: int = DB_WRITE_BEHIND_MAX_ROWS,
+    ):
         # Ensure the directory exists to avoid Docker volume mounting issues
         os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
         self.db_path = db_path
+
+        # One long-lived writer shared by all threads, plus a pool of readers.
+        # WAL lets readers run while the writer commits.
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        for pragma in DB_PRAGMAS:
+            self._writer.execute(pragma)
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(max(1, readers))
         self._init_db()
 
+        self.config = GlobalConfig()
+        with self._read_connection() as conn:
+            self.config.load(
+                conn.execute("SELECT key, value FROM global_config").fetchall()
+            )
+
+        # Read-through cache for user_settings; writes invalidate the entry
+        self.settings_cache = LRUCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL)
+
+        # Optional write-behind queue: message links and session touches are
+        # kept here and committed in one transaction by a background thread.
+        self._pending_lock = threading.Lock()
+        self._pending_links = {}  # (receiver_msg_id, receiver_chat_id) -> row
+        self._pending_sessions = {}  # (user_a, user_b) -> (anon_num, updated_at)
+        self._write_behind_rows = max(1, write_behind_rows)
+        self._flush_wakeup = threading.Event()
+        self._flusher = None
+        self._stopping = False
+        if write_behind_ms > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop,
+                args=(write_behind_ms / 1000,),
+                name="db-write-behind",
+                daemon=True,
+            )
+            self._flusher.start()
+
+    def _connect(self):
+        """Open a tuned connection that may be shared between threads."""
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=256
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
     @contextmanager
     def _get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Borrow the writer connection. Access is serialized across threads."""
+        with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                # Never leave a half-done transaction on the shared connection
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def _read_connection(self):
+        """Borrow a pooled connection for read-only queries."""
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._readers.put(conn)
+
+    def _flush_loop(self, interval: float):
+        """Background thread committing queued writes every `interval` seconds."""
+        while not self._stopping:
+            self._flush_wakeup.wait(interval)
+            self._flush_wakeup.clear()
+            try:
+                self.flush_pending()
+            except Exception as e:
+                logging.error(f"Write-behind flush failed: {e}")
+
+    def _enqueue(self, queue_dict: dict, key, value):
+        """Queue a write-behind row, waking the flusher when the batch is full."""
+        with self._pending_lock:
+            queue_dict[key] = value
+            pending = len(self._pending_links) + len(self._pending_sessions)
+        if pending >= self._write_behind_rows:
+            self._flush_wakeup.set()
+
+    def flush_pending(self):
+        """Commit all queued message links and session touches in one transaction."""
+        with self._get_connection() as conn:
+            with self._pending_lock:
+                links = dict(self._pending_links)
+                sessions = dict(self._pending_sessions)
+            if not links and not sessions:
+                return
+
+            conn.executemany(SAVE_LINK_SQL, links.values())
+            conn.executemany(
+                UPSERT_SESSION_SQL,
+                [
+                    (u1, u2, anon_num, ts)
+                    for (u1, u2), (anon_num, ts) in sessions.items()
+                    if anon_num
+                ],
+            )
+            conn.executemany(
+                TOUCH_SESSION_SQL,
+                [
+                    (ts, u1, u2)
+                    for (u1, u2), (anon_num, ts) in sessions.items()
+                    if not anon_num
+                ],
+            )
+            conn.executemany(
+                TOUCH_IDENTITIES_SQL,
+                [(ts, u1, u2) for (u1, u2), (_, ts) in sessions.items()],
+            )
+            conn.commit()
+
+            # Drop only what was written; rows queued meanwhile stay pending
+            with self._pending_lock:
+                for key, row in links.items():
+                    if self._pending_links.get(key) is row:
+                        del self._pending_links[key]
+                for key, row in sessions.items():
+                    if self._pending_sessions.get(key) is row:
+                        del self._pending_sessions[key]
+
+    def _flush_if_pending(self, links: bool = True, sessions: bool = True):
+        """Make queued writes visible before a query that reads them from disk."""
+        if (links and self._pending_links) or (sessions and self._pending_sessions):
+            self.flush_pending()
+
+    def close(self):
+        """Flush queued writes and close all pooled connections (called on shutdown)."""
+        self._stopping = True
+        if self._flusher:
+            self._flush_wakeup.set()
+            self._flusher.join()
+        self.flush_pending()
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    # Ordered schema migrations; applying entry N sets user_version to N + 1
+    MIGRATIONS = (
+        "_migrate_base_schema",
+        "_migrate_hot_indexes",
+        "_migrate_retention_indexes",
+        "_migrate_anon_num_index",
+        "_migrate_counters",
+        "_migrate_broadcasts",
+        "_migrate_fsm_state",
+        "_migrate_media_file_ids",
+        "_migrate_file_id_retention",
+    )
 
     def _init_db(self):
-        """Initialize database schema and perform migrations."""
+        """Bring the schema up to date by running pending migrations.
+        The applied version is kept in SQLite's user_version."""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # message_links: tracks which message in receiver's chat maps to which sender
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS message_links (
-                    receiver_msg_id INTEGER,
-                    receiver_chat_id INTEGER,
-                    sender_id INTEGER,
-                    sender_msg_id INTEGER,
-                    sender_chat_id INTEGER,
-                    anon_num TEXT,
-                    poll_id TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (receiver_msg_id, receiver_chat_id)
-                )
-            """)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, name in enumerate(self.MIGRATIONS, start=1):
+                if version >= target:
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                getattr(self, name)(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
 
-            # Check if columns exist (for migration)
-            cursor.execute("PRAGMA table_info(message_links)")
-            columns = [column[1] for column in cursor.fetchall()]
+    def _migrate_base_schema(self, cursor):
+        """v1: base tables, including upgrades of pre-versioning databases."""
+        # message_links: tracks which message in receiver's chat maps to which sender
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS message_links (
+                receiver_msg_id INTEGER,
+                receiver_chat_id INTEGER,
+                sender_id INTEGER,
+                sender_msg_id INTEGER,
+                sender_chat_id INTEGER,
+                anon_num TEXT,
+                poll_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (receiver_msg_id, receiver_chat_id)
+            )
+        """)
 
-            if "sender_msg_id" not in columns:
-                cursor.execute(
-                    "ALTER TABLE message_links ADD COLUMN sender_msg_id INTEGER"
-                )
-            if "sender_chat_id" not in columns:
-                cursor.execute(
-                    "ALTER TABLE message_links ADD COLUMN sender_chat_id INTEGER"
-                )
-            if "poll_id" not in columns:
-                cursor.execute("ALTER TABLE message_links ADD COLUMN poll_id TEXT")
-            if "created_at" not in columns:
-                cursor.execute(
-                    "ALTER TABLE message_links ADD COLUMN created_at TIMESTAMP"
-                )
-                cursor.execute(
-                    "UPDATE message_links SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"
-                )
-            if "anon_num" not in columns:
-                cursor.execute("ALTER TABLE message_links ADD COLUMN anon_num TEXT")
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_blocks (
-                    user_id INTEGER,
-                    blocked_sender_id INTEGER,
-                    blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    reason_msg_id INTEGER,
-                    PRIMARY KEY (user_id, blocked_sender_id)
-                )
-            """)
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id INTEGER PRIMARY KEY,
-                    lang TEXT DEFAULT 'uk',
-                    receive_media INTEGER DEFAULT 1,
-                    receive_messages INTEGER DEFAULT 1,
-                    auto_voice INTEGER DEFAULT 0,
-                    voice_gender TEXT DEFAULT 'm',
-                    skip_confirm_voice INTEGER DEFAULT 0,
-                    skip_confirm_media INTEGER DEFAULT 0
-                )
-            """)
-
-            # Migration for user_settings
-            cursor.execute("PRAGMA table_info(user_settings)")
-            settings_columns = [column[1] for column in cursor.fetchall()]
-            for col, d_type, d_val in [
-                ("receive_media", "INTEGER", 1),
-                ("receive_messages", "INTEGER", 1),
-                ("auto_voice", "INTEGER", 0),
-                ("voice_gender", "TEXT", "'m'"),
-                ("skip_confirm_voice", "INTEGER", 0),
-                ("skip_confirm_media", "INTEGER", 0),
-                ("anon_audio", "INTEGER", 1),
-            ]:
-                if col not in settings_columns:
-                    cursor.execute(
-                        f"ALTER TABLE user_settings ADD COLUMN {col} {d_type} DEFAULT {d_val}"
-                    )
+        # Check if columns exist (for migration)
+        cursor.execute("PRAGMA table_info(message_links)")
+        columns = [column[1] for column in cursor.fetchall()]
 
+        if "sender_msg_id" not in columns:
+            cursor.execute("ALTER TABLE message_links ADD COLUMN sender_msg_id INTEGER")
+        if "sender_chat_id" not in columns:
+            cursor.execute(
+                "ALTER TABLE message_links ADD COLUMN sender_chat_id INTEGER"
+            )
+        if "poll_id" not in columns:
+            cursor.execute("ALTER TABLE message_links ADD COLUMN poll_id TEXT")
+        if "created_at" not in columns:
+            cursor.execute("ALTER TABLE message_links ADD COLUMN created_at TIMESTAMP")
             cursor.execute(
-                "UPDATE user_settings SET anon_audio = 1 WHERE anon_audio IS NULL OR anon_audio = 0"
+                "UPDATE message_links SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"
             )
+        if "anon_num" not in columns:
+            cursor.execute("ALTER TABLE message_links ADD COLUMN anon_num TEXT")
 
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS active_sessions (
-                    user_a INTEGER,
-                    user_b INTEGER,
-                    anon_num TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (user_a, user_b)
-                )
-            """)
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS anon_identities (
-                    sender_id INTEGER,
-                    receiver_id INTEGER,
-                    anon_num TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (sender_id, receiver_id)
-                )
-            """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_blocks (
+                user_id INTEGER,
+                blocked_sender_id INTEGER,
+                blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reason_msg_id INTEGER,
+                PRIMARY KEY (user_id, blocked_sender_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id INTEGER PRIMARY KEY,
+                lang TEXT DEFAULT 'uk',
+                receive_media INTEGER DEFAULT 1,
+                receive_messages INTEGER DEFAULT 1,
+                auto_voice INTEGER DEFAULT 0,
+                voice_gender TEXT DEFAULT 'm',
+                skip_confirm_voice INTEGER DEFAULT 0,
+                skip_confirm_media INTEGER DEFAULT 0
+            )
+        """)
 
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS global_config (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
+        # Migration for user_settings
+        cursor.execute("PRAGMA table_info(user_settings)")
+        settings_columns = [column[1] for column in cursor.fetchall()]
+        for col, d_type, d_val in [
+            ("receive_media", "INTEGER", 1),
+            ("receive_messages", "INTEGER", 1),
+            ("auto_voice", "INTEGER", 0),
+            ("voice_gender", "TEXT", "'m'"),
+            ("skip_confirm_voice", "INTEGER", 0),
+            ("skip_confirm_media", "INTEGER", 0),
+            ("anon_audio", "INTEGER", 1),
+        ]:
+            if col not in settings_columns:
+                cursor.execute(
+                    f"ALTER TABLE user_settings ADD COLUMN {col} {d_type} DEFAULT {d_val}"
                 )
-            """)
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS cooldowns (
-                    sender_id INTEGER,
-                    receiver_id INTEGER,
-                    last_sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (sender_id, receiver_id)
+
+        cursor.execute(
+            "UPDATE user_settings SET anon_audio = 1 WHERE anon_audio IS NULL OR anon_audio = 0"
+        )
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS active_sessions (
+                user_a INTEGER,
+                user_b INTEGER,
+                anon_num TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_a, user_b)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS anon_identities (
+                sender_id INTEGER,
+                receiver_id INTEGER,
+                anon_num TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (sender_id, receiver_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS global_config (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cooldowns (
+                sender_id INTEGER,
+                receiver_id INTEGER,
+                last_sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (sender_id, receiver_id)
+            )
+        """)
+
+    def _migrate_hot_indexes(self, cursor):
+        """v2: secondary indexes for the hot lookups."""
+        # get_link_by_poll
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_links_poll ON message_links (poll_id) WHERE poll_id IS NOT NULL"
+        )
+        # is_sender_anon, get_last_msg_timestamp (ordered by created_at)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_links_sender_receiver ON message_links (sender_id, receiver_chat_id, created_at)"
+        )
+        # anon-number scan by receiver over the last 30 days (covering)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_identities_receiver ON anon_identities (receiver_id, updated_at, anon_num)"
+        )
+        # session cleaner range scan
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_updated ON active_sessions (updated_at)"
+        )
+
+    def _migrate_retention_indexes(self, cursor):
+        """v3: timestamp indexes for the chunked retention scans."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_links_created ON message_links (created_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_identities_updated ON anon_identities (updated_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cooldowns_sent ON cooldowns (last_sent_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_blocks_blocked ON user_blocks (blocked_at)"
+        )
+
+    def _migrate_anon_num_index(self, cursor):
+        """v4: lookup of a receiver's number for the allocator probes."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_identities_num ON anon_identities (receiver_id, anon_num, updated_at)"
+        )
+
+    def _migrate_counters(self, cursor):
+        """v5: integer usage counters, moved out of global_config."""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(
+            "INSERT OR REPLACE INTO counters (name, value) SELECT key, CAST(value AS INTEGER) FROM global_config WHERE key LIKE 'speech_usage_%'"
+        )
+        cursor.execute("DELETE FROM global_config WHERE key LIKE 'speech_usage_%'")
+
+    def _migrate_broadcasts(self, cursor):
+        """v6: resumable broadcasts and their failed recipients."""
+        # last_user_id is the keyset cursor over user_settings.user_id
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                from_chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                last_user_id INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_failures (
+                broadcast_id INTEGER,
+                user_id INTEGER,
+                error TEXT,
+                PRIMARY KEY (broadcast_id, user_id)
+            ) WITHOUT ROWID
+        """)
+
+    def _migrate_fsm_state(self, cursor):
+        """v7: persistent FSM state (see fsm_storage.SQLiteStorage)."""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm_state (updated_at)"
+        )
+
+    def _migrate_media_file_ids(self, cursor):
+        """v8: Telegram file_ids of uploaded local media, by content hash."""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS media_file_ids (
+                content_key TEXT,
+                media_type TEXT,
+                file_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_key, media_type)
+            ) WITHOUT ROWID
+        """)
+
+    def _migrate_file_id_retention(self, cursor):
+        """v9: timestamp index for pruning media_file_ids."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_file_ids_created ON media_file_ids (created_at)"
+        )
+
+    def get_free_bytes(self) -> int:
+        """Bytes held by free pages, i.e. space reusable without growing the file."""
+        with self._read_connection() as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            return free_pages * page_size
+
+    # Row keys of WITHOUT ROWID tables, for chunked deletes
+    PRUNE_KEYS = {"media_file_ids": "content_key, media_type"}
+
+    def prune_expired(self, table: str, column: str, days: int, limit: int) -> int:
+        """Delete up to `limit` rows of `table` older than `days` in one short
+        transaction. Returns the number of deleted rows; call again until 0."""
+        key = self.PRUNE_KEYS.get(table, "rowid")
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE ({key}) IN "
+                f"(SELECT {key} FROM {table} WHERE {column} < datetime('now', ?) LIMIT ?)",
+                (f"-{int(days)} days", limit),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def _attach_archive(self, conn):
+        """Attach the archive database to the writer connection once."""
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        if "archive" in attached:
+            return
+        conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive.message_links (
+                receiver_msg_id INTEGER,
+                receiver_chat_id INTEGER,
+                sender_id INTEGER,
+                sender_msg_id INTEGER,
+                sender_chat_id INTEGER,
+                anon_num TEXT,
+                poll_id TEXT,
+                created_at TIMESTAMP,
+                PRIMARY KEY (receiver_msg_id, receiver_chat_id)
+            ) WITHOUT ROWID
+        """)
+
+    def archive_message_links(self, days: int, limit: int) -> int:
+        """Move up to `limit` message links older than `days` into the archive
+        database in one transaction. Returns the number of moved rows.
+
+        The newest link of each sender -> receiver direction stays in place,
+        so is_sender_anon and get_last_msg_timestamp keep answering for
+        dialogues older than the reply window."""
+        with self._get_connection() as conn:
+            self._attach_archive(conn)
+            rowids = [
+                row[0]
+                for row in conn.execute(
+                    """SELECT rowid FROM main.message_links AS old
+                    WHERE created_at < datetime('now', ?)
+                    AND EXISTS (SELECT 1 FROM main.message_links AS newer
+                        WHERE newer.sender_id = old.sender_id
+                        AND newer.receiver_chat_id = old.receiver_chat_id
+                        AND newer.created_at > old.created_at)
+                    LIMIT ?""",
+                    (f"-{int(days)} days", limit),
                 )
-            """)
+            ]
+            if not rowids:
+                return 0
+            placeholders = ", ".join("?" * len(rowids))
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.message_links SELECT receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, sender_chat_id, anon_num, poll_id, created_at FROM main.message_links WHERE rowid IN ({placeholders})",
+                rowids,
+            )
+            conn.execute(
+                f"DELETE FROM main.message_links WHERE rowid IN ({placeholders})",
+                rowids,
+            )
             conn.commit()
+            return len(rowids)
 
     def save_message_link(
         self,
@@ -158,26 +716,43 @@ class Database:
         poll_id=None,
     ):
         """Save a link between sent and received messages for reply tracking."""
+        row = (
+            receiver_msg_id,
+            receiver_chat_id,
+            sender_id,
+            sender_msg_id,
+            sender_chat_id,
+            anon_num,
+            poll_id,
+            _utc_now(),
+        )
+        if self._flusher:
+            self._enqueue(self._pending_links, (receiver_msg_id, receiver_chat_id), row)
+            return
         with self._get_connection() as conn:
-            conn.execute(
-                """INSERT OR REPLACE INTO message_links 
-                   (receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, sender_chat_id, anon_num, poll_id, created_at) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
-                (
-                    receiver_msg_id,
-                    receiver_chat_id,
-                    sender_id,
-                    sender_msg_id,
-                    sender_chat_id,
-                    anon_num,
-                    poll_id,
-                ),
-            )
+            conn.execute(SAVE_LINK_SQL, row)
+            conn.commit()
+
+    def save_message_links(self, links):
+        """Save several links in one transaction, e.g. one per album message.
+        Each link is (receiver_msg_id, receiver_chat_id, sender_id,
+        sender_msg_id, sender_chat_id, anon_num)."""
+        now = _utc_now()
+        rows = [(*link, None, now) for link in links]
+        if self._flusher:
+            for row in rows:
+                self._enqueue(self._pending_links, (row[0], row[1]), row)
+            return
+        with self._get_connection() as conn:
+            conn.executemany(SAVE_LINK_SQL, rows)
             conn.commit()
 
     def get_link_by_receiver(self, msg_id, chat_id):
         """Get sender info by the message ID in the receiver's chat."""
-        with self._get_connection() as conn:
+        pending = self._pending_links.get((msg_id, chat_id))
+        if pending:
+            return pending[2], pending[3], pending[4], pending[5]
+        with self._read_connection() as conn:
             res = conn.execute(
                 "SELECT sender_id, sender_msg_id, sender_chat_id, anon_num FROM message_links WHERE receiver_msg_id = ? AND receiver_chat_id = ?",
                 (msg_id, chat_id),
@@ -186,7 +761,8 @@ class Database:
 
     def get_link_by_poll(self, poll_id):
         """Get sender info linked to a specific poll."""
-        with self._get_connection() as conn:
+        self._flush_if_pending(sessions=False)
+        with self._read_connection() as conn:
             return conn.execute(
                 "SELECT sender_id, receiver_msg_id, receiver_chat_id FROM message_links WHERE poll_id = ?",
                 (poll_id,),
@@ -230,7 +806,7 @@ class Database:
 
     def is_blocked(self, user_id, sender_id):
         """Check if a sender is blocked by a user."""
-        with self._get_connection() as conn:
+        with self._read_connection() as conn:
             return (
                 conn.execute(
                     "SELECT 1 FROM user_blocks WHERE user_id = ? AND blocked_sender_id = ?",
@@ -241,7 +817,7 @@ class Database:
 
     def get_blocked_list(self, user_id):
         """Get list of users blocked by a specific user."""
-        with self._get_connection() as conn:
+        with self._read_connection() as conn:
             return conn.execute(
                 "SELECT blocked_sender_id, blocked_at, reason_msg_id FROM user_blocks WHERE user_id = ? ORDER BY blocked_at ASC",
                 (user_id,),
@@ -250,7 +826,8 @@ class Database:
     def is_sender_anon(self, target_id: int, sender_id: int) -> bool:
         """Check if the sender is the anonymous user in the relationship between target and sender.
         Defaults to True for the very first message initiated via referral link."""
-        with self._get_connection() as conn:
+        self._flush_if_pending(sessions=False)
+        with self._read_connection() as conn:
             # Check if target initiated the conversation (target is anon, sender is link owner)
             res = conn.execute(
                 "SELECT 1 FROM message_links WHERE sender_id = ? AND receiver_chat_id = ?",
@@ -262,11 +839,8 @@ class Database:
 
     def get_user_lang(self, user_id, default="uk"):
         """Get user's selected language."""
-        with self._get_connection() as conn:
-            res = conn.execute(
-                "SELECT lang FROM user_settings WHERE user_id = ?", (user_id,)
-            ).fetchone()
-            return res[0] if res else default
+        settings = self.get_user_settings(user_id)
+        return settings.lang if settings.persisted else default
 
     def set_user_lang(self, user_id, lang):
         """Set user's language."""
@@ -276,28 +850,55 @@ class Database:
                 (user_id, lang, lang),
             )
             conn.commit()
+        self.settings_cache.invalidate(user_id)
 
-    def get_user_settings(self, user_id):
+    def get_user_settings(self, user_id) -> UserSettings:
         """Get all settings for a user with defaults if not exists."""
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT * FROM user_settings WHERE user_id = ?", (user_id,)
-            )
-            res = cursor.fetchone()
-            if not res:
-                return {
-                    "user_id": user_id,
-                    "lang": "uk",
-                    "receive_media": 1,
-                    "receive_messages": 1,
-                    "auto_voice": 0,
-                    "voice_gender": "rnd",
-                    "anon_audio": 1,
-                    "skip_confirm_voice": 0,
-                    "skip_confirm_media": 0,
-                }
-            columns = [column[0] for column in cursor.description]
-            return dict(zip(columns, res))
+        settings = self.settings_cache.get(user_id)
+        if settings is not None:
+            return settings
+        return self._load_user_settings(user_id)
+
+    def _load_user_settings(self, user_id, conn=None) -> UserSettings:
+        """Read settings from disk and populate the cache."""
+        if conn is None:
+            with self._read_connection() as conn:
+                return self._load_user_settings(user_id, conn)
+
+        generation = self.settings_cache.generation
+        res = conn.execute(
+            f"SELECT {', '.join(UserSettings.FIELDS)} FROM user_settings WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        settings = UserSettings(*res, persisted=True) if res else UserSettings(user_id)
+        self.settings_cache.set(user_id, settings, generation)
+        return settings
+
+    def get_delivery_context(self, target_id: int, sender_id: int) -> DeliveryContext:
+        """Load settings, languages, block status and the existing anon number
+        for a delivery in one read transaction. Cached settings are reused."""
+        with self._read_connection() as conn:
+            conn.execute("BEGIN")
+            target = self.settings_cache.get(target_id) or self._load_user_settings(
+                target_id, conn
+            )
+            sender = self.settings_cache.get(sender_id) or self._load_user_settings(
+                sender_id, conn
+            )
+            is_blocked, anon_num = conn.execute(
+                """SELECT
+                    EXISTS (SELECT 1 FROM user_blocks WHERE user_id = ? AND blocked_sender_id = ?),
+                    (SELECT anon_num FROM anon_identities WHERE sender_id = ? AND receiver_id = ?)""",
+                (target_id, sender_id, sender_id, target_id),
+            ).fetchone()
+            conn.commit()
+        return DeliveryContext(
+            target_settings=target,
+            target_lang=(target.lang if target.persisted else None) or "uk",
+            sender_lang=(sender.lang if sender.persisted else None) or "uk",
+            is_blocked=bool(is_blocked),
+            anon_num=anon_num,
+        )
 
     def update_user_settings(self, user_id, **kwargs):
         """Batch update user settings."""
@@ -318,11 +919,13 @@ class Database:
                     full_values,
                 )
             conn.commit()
+        self.settings_cache.invalidate(user_id)
 
     def get_admin_stats(self):
         """Get global bot statistics."""
         stats = {}
-        with self._get_connection() as conn:
+        self._flush_if_pending(sessions=False)
+        with self._read_connection() as conn:
             stats["msg_total"] = conn.execute(
                 "SELECT COUNT(*) FROM message_links"
             ).fetchone()[0]
@@ -339,97 +942,149 @@ class Database:
             ).fetchone()[0]
         return stats
 
-    def check_and_reserve_cooldown(
-        self, sender_id: int, receiver_id: int, cd_seconds: int
-    ) -> tuple[bool, int]:
-        """Check if cooldown is active and update it if allowed. Returns (is_allowed, remaining_seconds)."""
-        if cd_seconds <= 0:
-            return True, 0
+    def load_cooldowns(self):
+        """Get the last snapshot of per-pair cooldowns as (sender, receiver, epoch)."""
+        with self._read_connection() as conn:
+            return conn.execute(
+                "SELECT sender_id, receiver_id, CAST(strftime('%s', last_sent_at) AS INTEGER) FROM cooldowns"
+            ).fetchall()
+
+    def save_cooldowns(self, rows):
+        """Replace the cooldown snapshot with (sender, receiver, epoch) rows."""
         with self._get_connection() as conn:
-            res = conn.execute(
-                "SELECT strftime('%s', last_sent_at) FROM cooldowns WHERE sender_id = ? AND receiver_id = ?",
-                (sender_id, receiver_id),
-            ).fetchone()
-            now = int(time.time())
-            if res and res[0]:
-                last_ts = int(res[0])
-                if now - last_ts < cd_seconds:
-                    return False, cd_seconds - (now - last_ts)
-            conn.execute(
-                "INSERT OR REPLACE INTO cooldowns (sender_id, receiver_id, last_sent_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
-                (sender_id, receiver_id),
+            conn.execute("DELETE FROM cooldowns")
+            conn.executemany(
+                "INSERT INTO cooldowns (sender_id, receiver_id, last_sent_at) VALUES (?, ?, datetime(?, 'unixepoch'))",
+                rows,
             )
             conn.commit()
-            return True, 0
 
     def get_or_create_anon_num(self, receiver_id: int, sender_id: int) -> str:
         """Find or create a DIRECTIONAL anonymous number for sender->receiver pair.
         A->B and B->A will have different numbers."""
+        with self._read_connection() as conn:
+            res = conn.execute(
+                "SELECT anon_num FROM anon_identities WHERE sender_id = ? AND receiver_id = ?",
+                (sender_id, receiver_id),
+            ).fetchone()
+        if res:
+            return res[0]
+        return self._allocate_anon_num(receiver_id, sender_id)
+
+    def _allocate_anon_num(self, receiver_id: int, sender_id: int) -> str:
+        """Allocate a number unused by this receiver in the recycle window.
+
+        Numbers are picked by random probing through the
+        (receiver_id, anon_num, updated_at) index, so each attempt costs one
+        index lookup regardless of how many senders the receiver has. When a
+        range is nearly full the next, wider range is used. Everything,
+        including the session upsert, happens in one IMMEDIATE transaction,
+        so concurrent first messages cannot collide.
+        """
+        u1, u2 = sorted([sender_id, receiver_id])
         with self._get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another caller may have allocated while we waited for the lock
             res = conn.execute(
                 "SELECT anon_num FROM anon_identities WHERE sender_id = ? AND receiver_id = ?",
                 (sender_id, receiver_id),
             ).fetchone()
             if res:
+                conn.commit()
                 return res[0]
 
-            # Pick a number not used by this receiver recently
-            cursor = conn.execute(
-                "SELECT anon_num FROM anon_identities WHERE receiver_id = ? AND updated_at > datetime('now', '-30 days')",
-                (receiver_id,),
-            )
-            taken_nums = {row[0] for row in cursor.fetchall()}
-
-            pool = [f"№{i:03d}" for i in range(1, 1000)]
-            available = [n for n in pool if n not in taken_nums]
-            picked = (
-                random.choice(available)
-                if available
-                else f"№{random.randint(1000, 9999):03d}"
-            )
+            picked = None
+            for low, high in ANON_NUM_RANGES:
+                for _ in range(ANON_NUM_PROBES):
+                    candidate = f"№{random.randint(low, high):03d}"
+                    taken = conn.execute(
+                        "SELECT 1 FROM anon_identities WHERE receiver_id = ? AND anon_num = ? AND updated_at > datetime('now', ?) LIMIT 1",
+                        (receiver_id, candidate, f"-{ANON_NUM_RECYCLE_DAYS} days"),
+                    ).fetchone()
+                    if not taken:
+                        picked = candidate
+                        break
+                if picked:
+                    break
+            else:
+                # Every range is saturated; reuse the last probe
+                picked = candidate
 
             conn.execute(
                 "INSERT OR REPLACE INTO anon_identities (sender_id, receiver_id, anon_num) VALUES (?, ?, ?)",
                 (sender_id, receiver_id, picked),
             )
+            # Also keep active_sessions updated for session management
+            with self._pending_lock:
+                self._pending_sessions.pop((u1, u2), None)
+            conn.execute(UPSERT_SESSION_SQL, (u1, u2, picked, _utc_now()))
             conn.commit()
-
-        # Also keep active_sessions updated for session management
-        self.update_session(sender_id, receiver_id, picked)
         return picked
 
     def update_session(self, sender_id: int, receiver_id: int, anon_num: str = None):
         """Register or update a shared session for a user pair."""
         u1, u2 = sorted([sender_id, receiver_id])
+        now = _utc_now()
+        if self._flusher:
+            with self._pending_lock:
+                # A plain touch must not drop an upsert queued for the same pair
+                queued = self._pending_sessions.get((u1, u2))
+            if not anon_num and queued:
+                anon_num = queued[0]
+            self._enqueue(self._pending_sessions, (u1, u2), (anon_num, now))
+            return
         with self._get_connection() as conn:
             if anon_num:
-                conn.execute(
-                    "INSERT INTO active_sessions (user_a, user_b, anon_num, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) ON CONFLICT(user_a, user_b) DO UPDATE SET anon_num = excluded.anon_num, updated_at = CURRENT_TIMESTAMP",
-                    (u1, u2, anon_num),
-                )
+                conn.execute(UPSERT_SESSION_SQL, (u1, u2, anon_num, now))
             else:
-                conn.execute(
-                    "UPDATE active_sessions SET updated_at = CURRENT_TIMESTAMP WHERE user_a = ? AND user_b = ?",
-                    (u1, u2),
-                )
+                conn.execute(TOUCH_SESSION_SQL, (now, u1, u2))
+            conn.execute(TOUCH_IDENTITIES_SQL, (now, u1, u2))
             conn.commit()
 
     def delete_session(self, user_id_1: int, user_id_2: int):
         """Delete a shared session."""
         u1, u2 = sorted([user_id_1, user_id_2])
         with self._get_connection() as conn:
+            with self._pending_lock:
+                self._pending_sessions.pop((u1, u2), None)
             conn.execute(
                 "DELETE FROM active_sessions WHERE user_a = ? AND user_b = ?", (u1, u2)
             )
             conn.commit()
 
-    def get_global_config(self, key: str, default=None):
-        """Get a global configuration value."""
-        with self._get_connection() as conn:
+    def get_session_timestamp(self, user_id_1: int, user_id_2: int):
+        """Get last activity of a shared session in seconds, or None if absent."""
+        u1, u2 = sorted([user_id_1, user_id_2])
+        if (u1, u2) in self._pending_sessions:
+            self.flush_pending()
+        with self._read_connection() as conn:
             res = conn.execute(
-                "SELECT value FROM global_config WHERE key = ?", (key,)
+                "SELECT strftime('%s', updated_at) FROM active_sessions WHERE user_a = ? AND user_b = ?",
+                (u1, u2),
             ).fetchone()
-            return res[0] if res else default
+            return int(res[0]) if res and res[0] else None
+
+    def get_expired_sessions(self, minutes: int):
+        """Get user pairs whose session was idle for longer than `minutes`."""
+        self._flush_if_pending(links=False)
+        with self._read_connection() as conn:
+            return conn.execute(
+                "SELECT user_a, user_b FROM active_sessions WHERE updated_at < datetime('now', ?)",
+                (f"-{int(minutes)} minutes",),
+            ).fetchall()
+
+    def count_active_sessions(self, minutes: int = 5) -> int:
+        """Count sessions with activity in the last `minutes`."""
+        self._flush_if_pending(links=False)
+        with self._read_connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM active_sessions WHERE updated_at > datetime('now', ?)",
+                (f"-{int(minutes)} minutes",),
+            ).fetchone()[0]
+
+    def get_global_config(self, key: str, default=None):
+        """Get a global configuration value (raw string, served from memory)."""
+        return self.config.raw(key, default)
 
     def set_global_config(self, key: str, value):
         """Set a global configuration value."""
@@ -439,31 +1094,246 @@ class Database:
                 (key, str(value)),
             )
             conn.commit()
+        self.config.update(key, str(value))
 
     def get_last_msg_timestamp(self, sender_id: int, receiver_id: int) -> int:
         """Get timestamp of the last message between users in seconds."""
-        with self._get_connection() as conn:
+        self._flush_if_pending(sessions=False)
+        with self._read_connection() as conn:
             res = conn.execute(
                 "SELECT strftime('%s', created_at) FROM message_links WHERE sender_id = ? AND receiver_chat_id = ? ORDER BY created_at DESC LIMIT 1",
                 (sender_id, receiver_id),
             ).fetchone()
             return int(res[0]) if res and res[0] else 0
 
-    def increment_global_config(self, key, amount: int):
-        """Increment a global configuration value atomically."""
+    def load_counters(self):
+        """Get all persisted usage counters as (name, value) rows."""
+        with self._read_connection() as conn:
+            return conn.execute("SELECT name, value FROM counters").fetchall()
+
+    def add_counters(self, deltas: dict):
+        """Atomically add a batch of {name: amount} deltas to the counters."""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            res = cursor.execute(
-                "SELECT value FROM global_config WHERE key = ?", (key,)
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                deltas.items(),
+            )
+            conn.commit()
+
+    def create_broadcast(self, from_chat_id: int, message_id: int) -> Optional[int]:
+        """Start a broadcast of a stored message to every known user.
+        Returns None if another broadcast is still running."""
+        with self._get_connection() as conn:
+            # Checked in the INSERT itself so two processes cannot both start one
+            cursor = conn.execute(
+                """INSERT INTO broadcasts (from_chat_id, message_id, total)
+                SELECT ?, ?, (SELECT COUNT(*) FROM user_settings)
+                WHERE NOT EXISTS (SELECT 1 FROM broadcasts WHERE status = 'running')""",
+                (from_chat_id, message_id),
+            )
+            conn.commit()
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def get_running_broadcast(self):
+        """Get the unfinished broadcast as a dict, if there is one."""
+        with self._read_connection() as conn:
+            row = conn.execute(
+                "SELECT id, from_chat_id, message_id, last_user_id, total, sent, failed FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1"
             ).fetchone()
-            current = int(res[0]) if res and res[0] else 0
-            new_val = current + amount
-            cursor.execute(
-                "INSERT OR REPLACE INTO global_config (key, value) VALUES (?, ?)",
-                (key, str(new_val)),
+        if not row:
+            return None
+        keys = (
+            "id",
+            "from_chat_id",
+            "message_id",
+            "last_user_id",
+            "total",
+            "sent",
+            "failed",
+        )
+        return dict(zip(keys, row))
+
+    def get_broadcast_recipients(self, after_user_id: int, limit: int):
+        """Next page of user ids after the cursor (keyset pagination)."""
+        with self._read_connection() as conn:
+            return [
+                row[0]
+                for row in conn.execute(
+                    "SELECT user_id FROM user_settings WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after_user_id, limit),
+                )
+            ]
+
+    def save_broadcast_progress(
+        self, broadcast_id: int, last_user_id: int, sent: int, failures
+    ):
+        """Advance the cursor past a finished page and record its failures
+        as (user_id, error) rows."""
+        with self._get_connection() as conn:
+            conn.execute(
+                "UPDATE broadcasts SET last_user_id = ?, sent = sent + ?, failed = failed + ? WHERE id = ?",
+                (last_user_id, sent, len(failures), broadcast_id),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO broadcast_failures (broadcast_id, user_id, error) VALUES (?, ?, ?)",
+                [(broadcast_id, user_id, error) for user_id, error in failures],
+            )
+            conn.commit()
+
+    def finish_broadcast(self, broadcast_id: int, status: str = "done"):
+        with self._get_connection() as conn:
+            conn.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, broadcast_id),
             )
             conn.commit()
-            return new_val
+
+    def load_fsm_record(self, key: str, max_age: int):
+        """Get (state, data_json, updated_at) of an FSM record written within
+        the last `max_age` seconds, or None."""
+        with self._read_connection() as conn:
+            return conn.execute(
+                "SELECT state, data, updated_at FROM fsm_state WHERE key = ? AND updated_at >= ?",
+                (key, int(time.time()) - max_age),
+            ).fetchone()
+
+    def save_fsm_records(self, rows):
+        """Write a batch of (key, state, data_json, updated_at) FSM records in
+        one transaction. Empty records (no state, no data) are deleted."""
+        empty = [(row[0],) for row in rows if row[1] is None and row[2] == "{}"]
+        filled = [row for row in rows if not (row[1] is None and row[2] == "{}")]
+        with self._get_connection() as conn:
+            conn.executemany("DELETE FROM fsm_state WHERE key = ?", empty)
+            conn.executemany(
+                "INSERT OR REPLACE INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                filled,
+            )
+            conn.commit()
+
+    def get_fsm_file_paths(self, max_age: int):
+        """Local files (previews awaiting confirmation) referenced by FSM
+        records that have not expired."""
+        with self._read_connection() as conn:
+            rows = conn.execute(
+                "SELECT json_extract(data, '$.media_path'), json_extract(data, '$.current_preview_path') FROM fsm_state WHERE updated_at >= ?",
+                (int(time.time()) - max_age,),
+            ).fetchall()
+        return {path for row in rows for path in row if isinstance(path, str)}
+
+    def prune_fsm_state(self, max_age: int, limit: int) -> int:
+        """Delete up to `limit` FSM records idle for more than `max_age` seconds."""
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM fsm_state WHERE key IN (SELECT key FROM fsm_state WHERE updated_at < ? LIMIT ?)",
+                (int(time.time()) - max_age, limit),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def get_media_file_id(self, content_key: str, media_type: str):
+        """Get the file_id of previously uploaded media, if any."""
+        with self._read_connection() as conn:
+            res = conn.execute(
+                "SELECT file_id FROM media_file_ids WHERE content_key = ? AND media_type = ?",
+                (content_key, media_type),
+            ).fetchone()
+            return res[0] if res else None
+
+    def save_media_file_id(self, content_key: str, media_type: str, file_id: str):
+        with self._get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO media_file_ids (content_key, media_type, file_id) VALUES (?, ?, ?)",
+                (content_key, media_type, file_id),
+            )
+            conn.commit()
+
+    def delete_media_file_id(self, content_key: str, media_type: str):
+        with self._get_connection() as conn:
+            conn.execute(
+                "DELETE FROM media_file_ids WHERE content_key = ? AND media_type = ?",
+                (content_key, media_type),
+            )
+            conn.commit()
+
+
+class AsyncDatabase:
+    """Awaitable mirror of Database for use inside handlers.
+
+    Every public Database method is available as a coroutine with the same
+    signature. Reads run in parallel on a thread pool, writes are serialized
+    on a single dedicated thread, so SQLite never blocks the event loop.
+    """
+
+    # Methods that only read and may run concurrently
+    READ_METHODS = frozenset(
+        {
+            "get_link_by_receiver",
+            "get_link_by_poll",
+            "is_blocked",
+            "get_blocked_list",
+            "is_sender_anon",
+            "get_user_lang",
+            "get_user_settings",
+            "get_admin_stats",
+            "get_session_timestamp",
+            "get_expired_sessions",
+            "count_active_sessions",
+            "get_last_msg_timestamp",
+            "get_free_bytes",
+            "load_cooldowns",
+            "load_counters",
+            "get_delivery_context",
+            "get_running_broadcast",
+            "get_broadcast_recipients",
+            "load_fsm_record",
+            "get_fsm_file_paths",
+            "get_media_file_id",
+        }
+    )
+
+    def __init__(self, database: Database, readers: int = DB_READERS):
+        self.db = database
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, readers), thread_name_prefix="db-reader"
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+        executor = self._readers if name in self.READ_METHODS else self._writer
+
+        async def call(*args, **kwargs):
+            return await self._run(executor, method, *args, **kwargs)
+
+        call.__name__ = name
+        # Cache the wrapper so the lookup happens once per method
+        setattr(self, name, call)
+        return call
+
+    async def _run(self, executor, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(method, *args, **kwargs)
+        )
+
+    async def get_user_settings(self, user_id) -> UserSettings:
+        # Cache hits are answered inline, without a thread hop
+        settings = self.db.settings_cache.get(user_id)
+        if settings is not None:
+            return settings
+        return await self._run(self._readers, self.db._load_user_settings, user_id)
+
+    async def get_user_lang(self, user_id, default="uk"):
+        settings = await self.get_user_settings(user_id)
+        return settings.lang if settings.persisted else default
+
+    def close(self):
+        """Wait for queued queries to finish and stop the executors."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
 
 
 db = Database()
+adb = AsyncDatabase(db)
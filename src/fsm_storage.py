@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from copy import copy
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_MS, FSM_TTL_FLOOR
+from database import db, adb
+
+# Dirty records that wake the flusher before its interval is up
+FLUSH_BATCH = 256
+
+
+def fsm_ttl() -> int:
+    """Seconds an untouched FSM record lives: session_time, but at least
+    FSM_TTL_FLOOR so short sessions don't drop drafts and menus."""
+    return max(FSM_TTL_FLOOR, db.config.get("session_time") * 60)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(
+        self, state: Optional[str] = None, data: dict = None, updated_at: int = 0
+    ):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage kept in the fsm_state table, so dialogues survive restarts.
+
+    Recently used records (including empty ones, which most lookups of a
+    target's state hit) stay in an LRU of FSM_CACHE_SIZE entries. Changes
+    are batched and written in one transaction every FSM_FLUSH_MS. Records
+    not written for fsm_ttl() seconds are treated as empty and pruned by
+    the retention task; reading a record refreshes it before it gets close.
+    """
+
+    def __init__(self, maxsize: int = FSM_CACHE_SIZE, flush_ms: int = FSM_FLUSH_MS):
+        self.maxsize = max(1, maxsize)
+        self.flush_interval = max(0, flush_ms) / 1000
+        self._hot: "OrderedDict[str, _Record]" = OrderedDict()
+        # Records changed since the last flush (may already be evicted from _hot)
+        self._dirty: Dict[str, _Record] = {}
+        # Records of the batch being written, readable until the write is done
+        self._inflight: Dict[str, _Record] = {}
+        self._wakeup = None
+        self._flusher = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return (
+            f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+            f"{key.business_connection_id or ''}:{key.destiny}"
+        )
+
+    async def _get(self, key: StorageKey) -> Tuple[str, _Record]:
+        k = self._key(key)
+        ttl = fsm_ttl()
+        now = int(time.time())
+        rec = self._hot.get(k) or self._dirty.get(k) or self._inflight.get(k)
+        if rec is not None:
+            self.hits += 1
+            if rec.updated_at and rec.updated_at < now - ttl and k not in self._dirty:
+                rec = _Record()
+        else:
+            self.misses += 1
+            row = await adb.load_fsm_record(k, ttl)
+            loaded = _Record(row[0], json.loads(row[1]), row[2]) if row else _Record()
+            # A write may have landed while we were loading
+            rec = (
+                self._hot.get(k)
+                or self._dirty.get(k)
+                or self._inflight.get(k)
+                or loaded
+            )
+
+        self._hot[k] = rec
+        self._hot.move_to_end(k)
+        while len(self._hot) > self.maxsize:
+            self._hot.popitem(last=False)
+
+        # Keep records in active use from expiring
+        if (rec.state or rec.data) and rec.updated_at < now - ttl // 2:
+            self._mark(k, rec)
+        return k, rec
+
+    def _mark(self, k: str, rec: _Record):
+        rec.updated_at = int(time.time())
+        self._dirty[k] = rec
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if len(self._dirty) >= FLUSH_BATCH or not self.flush_interval:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending changes in one transaction."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        self._inflight.update(batch)
+        rows = [
+            (
+                k,
+                rec.state,
+                json.dumps(
+                    rec.data, separators=(",", ":"), ensure_ascii=False, default=str
+                ),
+                rec.updated_at,
+            )
+            for k, rec in batch.items()
+        ]
+        try:
+            await adb.save_fsm_records(rows)
+        except Exception as e:
+            logging.error(f"Error flushing FSM state: {e}")
+            # Keep them for the next attempt unless they changed meanwhile
+            for k, rec in batch.items():
+                self._dirty.setdefault(k, rec)
+        finally:
+            for k, rec in batch.items():
+                if self._inflight.get(k) is rec:
+                    del self._inflight[k]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, rec = await self._get(key)
+        rec.state = state.state if isinstance(state, State) else state
+        self._mark(k, rec)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, rec = await self._get(key)
+        return rec.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        k, rec = await self._get(key)
+        rec.data = data.copy()
+        self._mark(k, rec)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, rec = await self._get(key)
+        return rec.data.copy()
+
+    async def get_value(
+        self, storage_key: StorageKey, dict_key: str, default: Any = None
+    ) -> Any:
+        _, rec = await self._get(storage_key)
+        return copy(rec.data.get(dict_key, default))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._hot),
+            "dirty": len(self._dirty),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+storage = SQLiteStorage()
@@ -1,3 +1,4 @@
+import os
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from typing import Union
 from aiogram import Router, F, types, Bot
@@ -45,6 +46,27 @@ async def admin_set_cooldown_callback(callback: types.CallbackQuery, state: FSMC
     await callback.answer()
 
 
+@router.callback_query(F.data == "admin_broadcast")
+async def admin_broadcast_callback(callback: types.CallbackQuery, state: FSMContext):
+    from config import ADMIN_IDS
+    from logic.admin import format_broadcast_progress
+
+    if callback.from_user.id not in ADMIN_IDS:
+        return await callback.answer("У вас немає прав 🤡")
+
+    lang = await get_lang(callback.from_user.id, callback.message)
+    progress = format_broadcast_progress(lang)
+    if progress:
+        return await callback.answer(
+            l10n.format_value("admin.broadcast_busy", lang, progress=progress),
+            show_alert=True,
+        )
+
+    await state.set_state(Form.broadcast_message)
+    await callback.message.answer(l10n.format_value("admin.broadcast_prompt", lang))
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("admin_"))
 async def admin_generic_callback(callback: types.CallbackQuery):
     from config import ADMIN_IDS
@@ -258,6 +280,14 @@ async def confirm_media_send(
             l10n.format_value("error.data_missing", lang), show_alert=True
         )
 
+    if not os.path.exists(media_path):
+        # The preview is gone (e.g. removed while the bot was down)
+        lang = db.get_user_lang(callback.from_user.id)
+        await state.clear()
+        return await callback.answer(
+            l10n.format_value("error.session_expired", lang), show_alert=True
+        )
+
     await cleanup_previous_confirmation(callback.message.chat.id, state, bot)
 
     await handle_forwarding(
@@ -2,7 +2,7 @@ from aiogram import Bot, Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
-from database import db
+from database import adb
 from l10n import l10n
 from logic.session import get_active_target
 from logic.forwarding import handle_forwarding
@@ -115,7 +115,7 @@ async def process_active_session(
 
     target_id, reply_to_id, anon_num = await get_active_target(message, state, bot)
     if target_id:
-        user_settings = db.get_user_settings(message.from_user.id)
+        user_settings = await adb.get_user_settings(message.from_user.id)
         if not album and message.text and user_settings.get("auto_voice"):
             # For auto-voice, we call the handler directly with the text
             await handle_voice_synthesis(
@@ -155,14 +155,32 @@ async def process_setting_cooldown(message: Message, state: FSMContext):
         return await state.clear()
 
     if message.text and message.text.isdigit():
-        db.set_global_config("message_cooldown", int(message.text))
-        lang = db.get_user_lang(message.from_user.id)
+        await adb.set_global_config("message_cooldown", int(message.text))
+        lang = await adb.get_user_lang(message.from_user.id)
         await message.answer(
             l10n.format_value("admin.cooldown_set", lang, seconds=message.text)
         )
         await state.clear()
 
 
+@router.message(Form.broadcast_message)
+async def process_broadcast_message(message: Message, state: FSMContext, bot: Bot):
+    from config import ADMIN_IDS
+    from services.broadcast import broadcaster
+
+    await state.clear()
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    lang = await adb.get_user_lang(message.from_user.id)
+    if await broadcaster.start(bot, message.chat.id, message.message_id):
+        await message.answer(l10n.format_value("admin.broadcast_started", lang))
+    else:
+        await message.answer(
+            l10n.format_value("admin.broadcast_busy", lang, progress="")
+        )
+
+
 @router.message()
 async def process_unhandled(message: Message, state: FSMContext, bot: Bot):
     if message.chat.type != "private":
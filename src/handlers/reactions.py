@@ -1,15 +1,74 @@
+import asyncio
+import logging
+import time
 from aiogram import Router, Bot, types
 from aiogram.types import ReactionTypeEmoji, ReactionTypeCustomEmoji
 from l10n import l10n
-from database import db
+from config import REACTION_DEBOUNCE_MS
+from database import adb
 from utils import get_lang
+from services.send_scheduler import send_scheduler, Priority
 
 router = Router()
 
 
+class _Burst:
+    __slots__ = ("first", "last", "deadline")
+
+    def __init__(self, reaction: types.MessageReactionUpdated):
+        self.first = reaction
+        self.last = reaction
+        self.deadline = 0.0
+
+
+# (chat_id, message_id) -> reaction burst waiting for its window to close
+_bursts = {}
+
+
+def _reaction_key(reactions):
+    return sorted(
+        r.emoji if r.type == "emoji" else f"custom:{r.custom_emoji_id}"
+        for r in reactions or ()
+        if r.type in ("emoji", "custom_emoji")
+    )
+
+
 @router.message_reaction()
 async def on_reaction(reaction: types.MessageReactionUpdated, bot: Bot):
-    link = db.get_link_by_receiver(reaction.message_id, reaction.chat.id)
+    """Coalesce quick reaction changes on one message into a single update.
+    Each change restarts the window; only the final state is delivered."""
+    if REACTION_DEBOUNCE_MS <= 0:
+        return await _deliver_reaction(reaction, bot)
+
+    key = (reaction.chat.id, reaction.message_id)
+    burst = _bursts.get(key)
+    if burst is None:
+        burst = _bursts[key] = _Burst(reaction)
+        asyncio.create_task(_flush_burst(key, burst, bot))
+    burst.last = reaction
+    burst.deadline = time.monotonic() + REACTION_DEBOUNCE_MS / 1000
+
+
+async def _flush_burst(key, burst: _Burst, bot: Bot):
+    try:
+        while (wait := burst.deadline - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+    finally:
+        _bursts.pop(key, None)
+
+    # Cycling through reactions and back ends where it started: nothing to do
+    if _reaction_key(burst.first.old_reaction) == _reaction_key(
+        burst.last.new_reaction
+    ):
+        return
+    try:
+        await _deliver_reaction(burst.last, bot)
+    except Exception as e:
+        logging.error(f"Reaction delivery error: {e}")
+
+
+async def _deliver_reaction(reaction: types.MessageReactionUpdated, bot: Bot):
+    link = await adb.get_link_by_receiver(reaction.message_id, reaction.chat.id)
     if not link:
         return
 
@@ -26,11 +85,15 @@ async def on_reaction(reaction: types.MessageReactionUpdated, bot: Bot):
         if emoji:  # Corrected indentation for this block
             lang = await get_lang(original_sender_id)
             try:
-                await bot.send_message(
+                await send_scheduler.send(
                     original_sender_id,
-                    l10n.format_value("reaction_received", lang, emoji=emoji),
-                    reply_to_message_id=original_msg_id,
-                    parse_mode="HTML",
+                    lambda: bot.send_message(
+                        original_sender_id,
+                        l10n.format_value("reaction_received", lang, emoji=emoji),
+                        reply_to_message_id=original_msg_id,
+                        parse_mode="HTML",
+                    ),
+                    Priority.NOTIFICATION,
                 )
                 # Sync reaction back to sender's message
                 sync_reactions = []
@@ -43,18 +106,26 @@ async def on_reaction(reaction: types.MessageReactionUpdated, bot: Bot):
                         )
 
                 try:
-                    await bot.set_message_reaction(
-                        chat_id=original_chat_id,
-                        message_id=original_msg_id,
-                        reaction=sync_reactions,
+                    await send_scheduler.send(
+                        original_chat_id,
+                        lambda: bot.set_message_reaction(
+                            chat_id=original_chat_id,
+                            message_id=original_msg_id,
+                            reaction=sync_reactions,
+                        ),
+                        Priority.CONFIRMATION,
                     )
                 except Exception:
                     # Fallback to standard star if custom fails
                     try:
-                        await bot.set_message_reaction(
-                            chat_id=original_chat_id,
-                            message_id=original_msg_id,
-                            reaction=[ReactionTypeEmoji(emoji="✨")],
+                        await send_scheduler.send(
+                            original_chat_id,
+                            lambda: bot.set_message_reaction(
+                                chat_id=original_chat_id,
+                                message_id=original_msg_id,
+                                reaction=[ReactionTypeEmoji(emoji="✨")],
+                            ),
+                            Priority.CONFIRMATION,
                         )
                     except Exception:
                         pass
@@ -1,7 +1,13 @@
 from datetime import datetime
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from l10n import l10n
-from database import db
+from database import db, adb
+from services.send_scheduler import send_scheduler
+from services.broadcast import broadcaster
+from services.tts_cache import tts_cache
+from fsm_storage import storage
+from middlewares.media_group import media_group
+from update_queue import update_queue
 
 
 def get_admin_keyboard(lang: str) -> InlineKeyboardMarkup:
@@ -42,15 +48,32 @@ async def handle_report(message: Message, lang: str):
     await message.answer(l10n.format_value("report_sent", lang))
 
 
+def format_broadcast_progress(lang: str) -> str:
+    """One-line progress of the running broadcast, or "" if none."""
+    p = broadcaster.progress()
+    if not p:
+        return ""
+    eta = "—"
+    if p["eta"] is not None:
+        minutes, seconds = divmod(int(p["eta"]), 60)
+        eta = f"{minutes}:{seconds:02d}"
+    return l10n.format_value(
+        "admin_panel.broadcast_progress",
+        lang,
+        done=p["done"],
+        total=p["total"],
+        failed=p["failed"],
+        rate=f"{p['rate']:.1f}",
+        eta=eta,
+    )
+
+
 async def handle_admin_stats(message: Message, lang: str, edit: bool = False):
     """Show redesigned premium admin statistics."""
-    stats = db.get_admin_stats()
+    stats = await adb.get_admin_stats()
 
     # Get active sessions count (updated logic)
-    with db._get_connection() as conn:
-        active_sessions = conn.execute(
-            "SELECT COUNT(*) FROM active_sessions WHERE updated_at > datetime('now', '-5 minutes')"
-        ).fetchone()[0]
+    active_sessions = await adb.count_active_sessions(5)
 
     langs_str = "\n".join(
         [
@@ -60,7 +83,41 @@ async def handle_admin_stats(message: Message, lang: str, edit: bool = False):
     )
 
     # Get global cooldown
-    global_cd = db.get_global_config("message_cooldown", 0)
+    global_cd = db.config.get("message_cooldown")
+
+    cache_stats = db.settings_cache.stats()
+    settings_cache = f"{cache_stats['hit_rate']:.0%} ({cache_stats['size']})"
+
+    send_stats = send_scheduler.metrics()
+    send_queue = (
+        f"{sum(send_stats['queued'].values())} queued, "
+        f"{send_stats['in_flight']} in flight, {send_stats['retried']} retried"
+    )
+
+    queue_stats = update_queue.metrics()
+    updates = (
+        f"{queue_stats['pending']} queued, {queue_stats['busy']} busy, "
+        f"wait avg {queue_stats['avg_wait_ms']:.0f} ms, "
+        f"max {queue_stats['max_wait_ms']:.0f} ms"
+    )
+
+    fsm_stats = storage.stats()
+    fsm_cache = (
+        f"{fsm_stats['hit_rate']:.0%} ({fsm_stats['size']}, "
+        f"{fsm_stats['dirty']} unsaved)"
+    )
+
+    tts_stats = tts_cache.stats()
+    tts = (
+        f"{tts_stats['hit_rate']:.0%}, {tts_stats['entries']} clips, "
+        f"{tts_stats['bytes'] / 2**20:.0f}/{tts_stats['max_bytes'] / 2**20:.0f} MB"
+    )
+
+    album_stats = media_group.stats()
+    albums = (
+        f"{album_stats['albums']}, avg {album_stats['avg_delay'] * 1000:.0f} ms, "
+        f"max {album_stats['max_delay'] * 1000:.0f} ms"
+    )
 
     text = l10n.format_value(
         "admin_panel.title",
@@ -70,6 +127,13 @@ async def handle_admin_stats(message: Message, lang: str, edit: bool = False):
         total_blocks=stats["total_blocks"],
         active_sessions=active_sessions,
         global_cd=global_cd,
+        settings_cache=settings_cache,
+        send_queue=send_queue,
+        updates=updates,
+        fsm_cache=fsm_cache,
+        tts_cache=tts,
+        albums=albums,
+        broadcast=format_broadcast_progress(lang) or "—",
         langs=langs_str,
         time=datetime.now().strftime("%H:%M:%S"),
     )
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import logging
 from typing import List, Union
@@ -7,16 +8,18 @@ from aiogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     ReactionTypeEmoji,
-    FSInputFile,
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 
-from database import db
+from database import adb
 from l10n import l10n
-from utils import get_lang
 from states import Form
 from logic.ui import get_confirm_kb
+from services.rate_limiter import rate_limiter
+from services.send_scheduler import send_scheduler, Priority
+from services.tts_cache import tts_cache
+from services.file_ids import send_cached
 
 
 async def handle_forwarding(
@@ -34,31 +37,43 @@ async def handle_forwarding(
     media_type: str = None,
 ):
     """Centralized message forwarding logic with anonymity and settings enforcement."""
-    target_lang = await get_lang(target_id, bot=bot)
-    sender_lang = await get_lang(sender_id, bot=bot)
+    # Settings, languages, block status and identity in one DB round trip,
+    # read together with both sides' FSM state
+    target_state_ctx = FSMContext(
+        storage=state.storage,
+        key=StorageKey(bot_id=bot.id, chat_id=target_id, user_id=target_id),
+    )
+    ctx, target_data, sender_data, sender_state = await asyncio.gather(
+        adb.get_delivery_context(target_id, sender_id),
+        _safe_fsm_read(target_state_ctx.get_data(), {}),
+        _safe_fsm_read(state.get_data(), {}),
+        _safe_fsm_read(state.get_state(), None),
+    )
+    target_lang = ctx.target_lang
+    sender_lang = ctx.sender_lang
 
     # 1. Enforcement Checks
-    target_settings = db.get_user_settings(target_id)
-    if not target_settings.get("receive_messages", 1):
+    if not ctx.target_settings.get("receive_messages", 1):
         return await message.answer(
             l10n.format_value("user_disabled_messages", sender_lang)
         )
 
-    if db.is_blocked(target_id, sender_id):
+    if ctx.is_blocked:
         return await message.answer(l10n.format_value("msg_blocked", sender_lang))
 
     if check_cd:
-        cd_seconds = int(db.get_global_config("message_cooldown", "0"))
-        allowed, remain = db.check_and_reserve_cooldown(
-            sender_id, target_id, cd_seconds
-        )
+        allowed, remain = rate_limiter.check(sender_id, target_id)
         if not allowed:
             return await message.answer(
                 l10n.format_value("error.cooldown", sender_lang, seconds=remain)
             )
 
     # 2. Anonymity Logic
-    anon_display_name = anon_num or db.get_or_create_anon_num(target_id, sender_id)
+    anon_display_name = (
+        anon_num
+        or ctx.anon_num
+        or await adb.get_or_create_anon_num(target_id, sender_id)
+    )
 
     receiver_display_name = f"Anon {anon_display_name}"
 
@@ -66,23 +81,11 @@ async def handle_forwarding(
     # Can be the real name if they have it in their FSM.
     sender_user_display_name = anon_display_name
 
-    is_target_in_dialogue = False
-    try:
-        target_state_ctx = FSMContext(
-            storage=state.storage,
-            key=StorageKey(bot_id=bot.id, chat_id=target_id, user_id=target_id),
-        )
-        target_data = await target_state_ctx.get_data()
-        if target_data.get("target_id") == sender_id:
-            is_target_in_dialogue = True
-
-        # For the sender's confirmation, check their OWN state for a name
-        sender_data = await state.get_data()
-        if sender_data.get("target_id") == target_id and sender_data.get("target_name"):
-            sender_user_display_name = sender_data.get("target_name")
+    is_target_in_dialogue = target_data.get("target_id") == sender_id
 
-    except Exception:
-        pass
+    # For the sender's confirmation, check their OWN state for a name
+    if sender_data.get("target_id") == target_id and sender_data.get("target_name"):
+        sender_user_display_name = sender_data.get("target_name")
     # 3.5 Button Logic (DRY & clean UX)
     # We only show the Anon Identity and "Start Dialogue" button if the user is NOT in an active dialogue.
     # We attach it directly to the message to avoid "extra noise".
@@ -111,23 +114,49 @@ async def handle_forwarding(
     if is_target_in_dialogue:
         reply_to_id = None
 
+    # Replies jump the outbound queue ahead of fresh messages
+    priority = Priority.REPLY if reply_to_id else Priority.MESSAGE
+
+    # 3.6 Sender confirmation runs alongside delivery and is taken back if it fails
+    # Determine if the SENDER is in an active session to replace text with reaction
+    sender_in_active_session = sender_state == Form.writing_message
+    confirmation = asyncio.create_task(
+        _send_sender_confirmation(
+            message,
+            target_id,
+            sender_data,
+            sender_state,
+            sender_lang,
+            sender_in_active_session,
+            sender_user_display_name,
+        )
+    )
+
     # 4. Content Forwarding
     sent_msg = None
+    # (receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, sender_chat_id, anon_num)
+    links = []
     if media_path and media_type:
-        sent_msg = await _send_local_media(
-            bot,
-            target_id,
-            media_path,
-            media_type,
-            reply_to_id,
-            target_lang,
-            caption=message.caption or message.text,
-            reply_markup=msg_kb,
-        )
+        try:
+            sent_msg = await _send_local_media(
+                bot,
+                target_id,
+                media_path,
+                media_type,
+                reply_to_id,
+                target_lang,
+                caption=message.caption or message.text,
+                reply_markup=msg_kb,
+                priority=priority,
+            )
+        except Exception as e:
+            logging.error(f"Local media forward error: {e}")
     elif album:
         from aiogram.utils.media_group import MediaGroupBuilder
 
         media_group = MediaGroupBuilder(caption=message.caption)
+        # Album items in the order they were added, to link each sent message back
+        sources = []
         for m in album:
             if m.photo:
                 media_group.add_photo(media=m.photo[-1].file_id, has_spoiler=True)
@@ -135,30 +164,55 @@ async def handle_forwarding(
                 media_group.add_video(media=m.video.file_id, has_spoiler=True)
             elif m.document:
                 media_group.add_document(media=m.document.file_id)
+            else:
+                continue
+            sources.append(m)
 
         try:
-            msgs = await bot.send_media_group(
-                chat_id=target_id,
-                media=media_group.build(),
-                reply_to_message_id=reply_to_id,
+            media = media_group.build()
+            msgs = await send_scheduler.send(
+                target_id,
+                lambda: bot.send_media_group(
+                    chat_id=target_id,
+                    media=media,
+                    reply_to_message_id=reply_to_id,
+                ),
+                priority,
             )
             sent_msg = msgs[0]
+            links.extend(
+                (
+                    sent.message_id,
+                    target_id,
+                    sender_id,
+                    source.message_id,
+                    message.chat.id,
+                    anon_display_name,
+                )
+                for sent, source in zip(msgs, sources)
+            )
 
             # Media groups don't support reply_markup, so we send a tiny action button if needed
             if msg_kb:
-                action_msg = await bot.send_message(
+                action_msg = await send_scheduler.send(
                     target_id,
-                    f"👆 👤 {receiver_display_name}",
-                    reply_markup=msg_kb,
-                    reply_to_message_id=sent_msg.message_id,
+                    lambda: bot.send_message(
+                        target_id,
+                        f"👆 👤 {receiver_display_name}",
+                        reply_markup=msg_kb,
+                        reply_to_message_id=sent_msg.message_id,
+                    ),
+                    priority,
                 )
-                db.save_message_link(
-                    action_msg.message_id,
-                    target_id,
-                    sender_id,
-                    message.message_id,
-                    message.chat.id,
-                    anon_num=anon_display_name,
+                links.append(
+                    (
+                        action_msg.message_id,
+                        target_id,
+                        sender_id,
+                        message.message_id,
+                        message.chat.id,
+                        anon_display_name,
+                    )
                 )
         except Exception as e:
             logging.error(f"Media group forward error: {e}")
@@ -166,14 +220,14 @@ async def handle_forwarding(
         # 4. Content Forwarding (Secure for Anonymity)
         try:
             if override_text:
-                sent_msg = await bot.send_message(
+                send = lambda: bot.send_message(
                     target_id,
                     override_text,
                     reply_to_message_id=reply_to_id,
                     reply_markup=msg_kb,
                 )
             elif message.photo:
-                sent_msg = await bot.send_photo(
+                send = lambda: bot.send_photo(
                     chat_id=target_id,
                     photo=message.photo[-1].file_id,
                     caption=message.caption,
@@ -182,7 +236,7 @@ async def handle_forwarding(
                     reply_markup=msg_kb,
                 )
             elif message.video:
-                sent_msg = await bot.send_video(
+                send = lambda: bot.send_video(
                     chat_id=target_id,
                     video=message.video.file_id,
                     caption=message.caption,
@@ -191,7 +245,7 @@ async def handle_forwarding(
                     reply_markup=msg_kb,
                 )
             elif message.voice:
-                sent_msg = await bot.send_voice(
+                send = lambda: bot.send_voice(
                     chat_id=target_id,
                     voice=message.voice.file_id,
                     caption=message.caption,
@@ -199,51 +253,75 @@ async def handle_forwarding(
                     reply_markup=msg_kb,
                 )
             else:
-                sent_msg = await bot.copy_message(
+                send = lambda: bot.copy_message(
                     chat_id=target_id,
                     from_chat_id=message.chat.id,
                     message_id=message.message_id,
                     reply_to_message_id=reply_to_id,
                     reply_markup=msg_kb,
                 )
+            sent_msg = await send_scheduler.send(target_id, send, priority)
         except Exception as e:
             logging.error(f"Forwarding error: {e}")
             # Final fallback for text
             content = message.text or message.caption or "..."
-            sent_msg = await bot.send_message(
-                target_id, content, reply_to_message_id=reply_to_id, reply_markup=msg_kb
-            )
+            try:
+                sent_msg = await send_scheduler.send(
+                    target_id,
+                    lambda: bot.send_message(
+                        target_id,
+                        content,
+                        reply_to_message_id=reply_to_id,
+                        reply_markup=msg_kb,
+                    ),
+                    priority,
+                )
+            except Exception as e:
+                logging.error(f"Fallback forwarding error: {e}")
 
     if not sent_msg:
+        await _retract_confirmation(message, confirmation)
         return await message.answer("❌ Error forwarding message.")
 
-    db.save_message_link(
-        sent_msg.message_id,
-        target_id,
-        sender_id,
-        message.message_id,
-        message.chat.id,
-        anon_num=anon_display_name,
-    )
-
     # No extra notification message (merged directly as inline keyboard on target message)
 
-    # 5. Confirmation and State Update
-    # Determine if the SENDER is in an active session to replace text with reaction
-    sender_in_active_session = (await state.get_state()) == Form.writing_message
-
-    await _send_sender_confirmation(
-        message,
-        target_id,
-        state,
-        bot,
-        sender_lang,
-        sender_in_active_session,
-        sender_user_display_name,
+    # 5. Bookkeeping: links and session timestamp, alongside the confirmation
+    if not links:
+        links.append(
+            (
+                sent_msg.message_id,
+                target_id,
+                sender_id,
+                message.message_id,
+                message.chat.id,
+                anon_display_name,
+            )
+        )
+    await asyncio.gather(
+        adb.save_message_links(links),
+        adb.update_session(sender_id, target_id),
+        confirmation,
     )
 
-    # Update session timestamp on activity
-    db.update_session(sender_id, target_id)
+
+async def _safe_fsm_read(coro, default):
+    """Await an FSM read, falling back to `default` if storage fails."""
+    try:
+        return await coro
+    except Exception:
+        return default
+
+
+async def _retract_confirmation(message: Message, confirmation: asyncio.Task):
+    """Undo a confirmation that went out for a message that was not delivered."""
+    try:
+        sent = await confirmation
+        if sent is True:
+            await message.react(reactions=[])
+        elif sent:
+            await sent.delete()
+    except Exception as e:
+        logging.error(f"Confirmation retract error: {e}")
 
 
 async def _send_local_media(
@@ -255,35 +333,46 @@ async def _send_local_media(
     lang: str,
     caption: str = None,
     reply_markup=None,
+    priority: Priority = Priority.MESSAGE,
 ):
-    """Handle sending of local files (synthesis/generation results)."""
-    try:
+    """Handle sending of local files (synthesis/generation results).
+    Media uploaded before is sent by its file_id instead."""
+
+    def send(media):
         if m_type == "voice":
-            return await bot.send_voice(
+            return bot.send_voice(
                 target_id,
-                FSInputFile(path),
+                media,
                 reply_to_message_id=reply_to,
                 caption=caption,
                 reply_markup=reply_markup,
             )
         elif m_type == "video_note":
-            return await bot.send_video_note(
-                target_id,
-                FSInputFile(path),
-                reply_to_message_id=reply_to,
-                reply_markup=reply_markup,
-            )
-        elif m_type == "photo":
-            return await bot.send_photo(
+            return bot.send_video_note(
                 target_id,
-                FSInputFile(path),
-                caption=caption or l10n.format_value("received_card_caption", lang),
-                has_spoiler=True,
+                media,
                 reply_to_message_id=reply_to,
                 reply_markup=reply_markup,
             )
+        return bot.send_photo(
+            target_id,
+            media,
+            caption=caption or l10n.format_value("received_card_caption", lang),
+            has_spoiler=True,
+            reply_to_message_id=reply_to,
+            reply_markup=reply_markup,
+        )
+
+    try:
+        if m_type not in ("voice", "video_note", "photo"):
+            return None
+        return await send_cached(
+            path,
+            m_type,
+            lambda media: send_scheduler.send(target_id, lambda: send(media), priority),
+        )
     finally:
-        if os.path.exists(path):
+        if os.path.exists(path) and not tts_cache.owns(path):
             try:
                 os.remove(path)
             except Exception:
@@ -293,13 +382,14 @@ async def _send_local_media(
 async def _send_sender_confirmation(
     message: Message,
     target_id: int,
-    state: FSMContext,
-    bot: Bot,
+    data: dict,
+    current_state: str,
     lang: str,
     in_dialogue: bool,
     display_name: str,
 ):
-    data = await state.get_data()
+    """Confirm to the sender. Returns True for a reaction, the sent Message
+    for a text confirmation, or None if nothing was sent."""
     # If we have a saved name in FSM, use it for the sender's confirmation
     # display_name already contains the name or ID from handle_forwarding
     name_to_show = display_name or "№???"
@@ -307,8 +397,12 @@ async def _send_sender_confirmation(
     if in_dialogue:
         try:
             # Use ReactionTypeEmoji to be safe with types
-            await message.react(reactions=[ReactionTypeEmoji(emoji="✅")])
-            return
+            await send_scheduler.send(
+                message.chat.id,
+                lambda: message.react(reactions=[ReactionTypeEmoji(emoji="✅")]),
+                Priority.CONFIRMATION,
+            )
+            return True
         except Exception as e:
             # Fallback for old clients or bot restriction
             pass
@@ -317,7 +411,6 @@ async def _send_sender_confirmation(
     kb = None
 
     # Don't show "Start Dialogue" if we are ALREADY writing to this person
-    current_state = await state.get_state()
     is_already_writing = (current_state == Form.writing_message) and (
         data.get("target_id") == target_id
     )
@@ -340,4 +433,12 @@ async def _send_sender_confirmation(
         )
         kb = InlineKeyboardMarkup(inline_keyboard=[buttons])
 
-    await message.answer(sent_text, reply_markup=kb, parse_mode="HTML")
+    try:
+        return await send_scheduler.send(
+            message.chat.id,
+            lambda: message.answer(sent_text, reply_markup=kb, parse_mode="HTML"),
+            Priority.CONFIRMATION,
+        )
+    except Exception as e:
+        logging.error(f"Sender confirmation error: {e}")
+        return None
@@ -7,6 +7,7 @@ from database import db
 from states import Form
 from services.voice_engine import text_to_voice
 from services.image_engine import generate_image_input
+from services.file_ids import send_cached
 from logic.ui import get_confirm_kb
 from logic.forwarding import handle_forwarding
 from logic.session import cleanup_previous_confirmation
@@ -149,10 +150,14 @@ async def handle_voice_synthesis(
             )
             return
 
-        await message.answer_voice(
-            voice=FSInputFile(path),
-            caption=l10n.format_value("your_voice_preview", lang),
-            reply_markup=get_confirm_kb(lang),
+        await send_cached(
+            path,
+            "voice",
+            lambda media: message.answer_voice(
+                voice=media,
+                caption=l10n.format_value("your_voice_preview", lang),
+                reply_markup=get_confirm_kb(lang),
+            ),
         )
     except Exception as e:
         await message.answer(f"Error: {e}")
@@ -198,10 +203,14 @@ async def handle_pic_generation(
             )
             return
 
-        await message.answer_photo(
-            photo=FSInputFile(path),
-            caption=l10n.format_value("your_image_preview", lang),
-            reply_markup=get_confirm_kb(lang),
+        await send_cached(
+            path,
+            "photo",
+            lambda media: message.answer_photo(
+                photo=media,
+                caption=l10n.format_value("your_image_preview", lang),
+                reply_markup=get_confirm_kb(lang),
+            ),
         )
     except Exception as e:
         await message.answer(f"Error: {e}")
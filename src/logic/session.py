@@ -3,7 +3,7 @@ from aiogram import Bot
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
-from database import db
+from database import db, adb
 from l10n import l10n
 from utils import get_lang
 from states import Form
@@ -21,7 +21,7 @@ async def get_active_target(message: Message, state: FSMContext, bot: Bot):
 
     # 1. Reply to an anonymous message (Priority)
     if message.reply_to_message:
-        link = db.get_link_by_receiver(
+        link = await adb.get_link_by_receiver(
             message.reply_to_message.message_id, message.chat.id
         )
         if link:
@@ -29,7 +29,7 @@ async def get_active_target(message: Message, state: FSMContext, bot: Bot):
 
             # If replying to someone else, it's a one-off (don't break current session)
             if reply_target_id != active_target_id:
-                num_to_use = link_anon_num or db.get_or_create_anon_num(
+                num_to_use = link_anon_num or await adb.get_or_create_anon_num(
                     reply_target_id, message.from_user.id
                 )
                 return reply_target_id, reply_to_id, num_to_use
@@ -42,7 +42,9 @@ async def get_active_target(message: Message, state: FSMContext, bot: Bot):
     temp_target_id = state_data.get("temp_target_id")
     if temp_target_id:
         temp_reply_to_id = state_data.get("temp_reply_to_id")
-        num_to_use = db.get_or_create_anon_num(temp_target_id, message.from_user.id)
+        num_to_use = await adb.get_or_create_anon_num(
+            temp_target_id, message.from_user.id
+        )
         # Clear temp state IMMEDIATELY
         await state.update_data(
             temp_target_id=None, temp_reply_to_id=None, target_name=None
@@ -52,36 +54,21 @@ async def get_active_target(message: Message, state: FSMContext, bot: Bot):
     # 3. Persistent session logic
     if active_target_id:
         # Session expiry check
-        # DB returns string, convert to int
-        conf_session_min = db.get_global_config("session_time", "5")
-        try:
-            session_minutes = int(conf_session_min)
-        except (ValueError, TypeError):
-            session_minutes = 5
+        session_minutes = db.config.get("session_time")
 
         if session_minutes > 0:
             # Check session existence and timestamp in DB
-            with db._get_connection() as conn:
-                session_data = conn.execute(
-                    """SELECT strftime('%s', updated_at) FROM active_sessions 
-                       WHERE (user_a = ? AND user_b = ?) 
-                       OR (user_a = ? AND user_b = ?)""",
-                    (
-                        message.from_user.id,
-                        active_target_id,
-                        active_target_id,
-                        message.from_user.id,
-                    ),
-                ).fetchone()
-
-            if session_data and session_data[0]:
-                last_update = int(session_data[0])
+            last_update = await adb.get_session_timestamp(
+                message.from_user.id, active_target_id
+            )
+
+            if last_update:
                 current_time = _time.time()
                 diff_seconds = current_time - last_update
 
                 if diff_seconds > (session_minutes * 60):
                     # SESSION EXPIRED
-                    db.delete_session(message.from_user.id, active_target_id)
+                    await adb.delete_session(message.from_user.id, active_target_id)
                     await state.clear()
                     lang = await get_lang(message.from_user.id, message)
                     await message.answer(
@@ -94,15 +81,17 @@ async def get_active_target(message: Message, state: FSMContext, bot: Bot):
                 return None, None, None
 
         # Auto-dialogue check
-        is_auto = db.get_global_config("auto_dialogue", "1") == "1"
+        is_auto = db.config.get("auto_dialogue")
         if not is_auto:
             pass
 
         if not anon_num:
-            anon_num = db.get_or_create_anon_num(active_target_id, message.from_user.id)
+            anon_num = await adb.get_or_create_anon_num(
+                active_target_id, message.from_user.id
+            )
 
         # IMPORTANT: Always update the session timestamp on activity
-        db.update_session(message.from_user.id, active_target_id)
+        await adb.update_session(message.from_user.id, active_target_id)
         await state.update_data(target_id=active_target_id, anon_num=anon_num)
         await state.set_state(Form.writing_message)
         return active_target_id, reply_to_id, anon_num
@@ -2,19 +2,26 @@ import asyncio
 import logging
 import os
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from config import BOT_TOKEN, WEBHOOK_URL
+from database import db, adb
+from fsm_storage import storage, fsm_ttl
 from handlers import setup_handlers, commands
-from middlewares.media_group import MediaGroupMiddleware
+from middlewares.media_group import media_group
+from update_queue import OrderedUpdatesMiddleware, update_queue
 
 
 def startup_cleanup():
-    """Clean up temp directory on startup."""
+    """Clean up temp directory on startup.
+    Previews still referenced by a persisted FSM state are kept."""
     temp_dir = os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp"
     )
     if os.path.exists(temp_dir):
         print(f"Cleaning up temp directory: {temp_dir}")
+        keep = {os.path.abspath(p) for p in db.get_fsm_file_paths(fsm_ttl())}
         for f in os.listdir(temp_dir):
+            if os.path.abspath(os.path.join(temp_dir, f)) in keep:
+                continue
             try:
                 os.remove(os.path.join(temp_dir, f))
             except Exception as e:
@@ -32,22 +39,51 @@ async def main():
         return
 
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    dp = Dispatcher(storage=storage)
 
     # Setup handlers
     dp.include_router(setup_handlers())
-    dp.message.middleware(MediaGroupMiddleware())
+    dp.message.middleware(media_group)
+    if not WEBHOOK_URL:
+        # The webhook puts updates on the queue itself
+        dp.update.outer_middleware(OrderedUpdatesMiddleware(update_queue))
 
     # Register commands in menu
     await commands.set_commands(bot)
 
     # Start background tasks
     from tasks.session_cleaner import clean_stale_sessions
+    from tasks.retention import retention_worker
+    from tasks.rate_limits import snapshot_rate_limits
+    from tasks.counters import flush_counters
     asyncio.create_task(clean_stale_sessions(bot, dp.storage))
+    asyncio.create_task(retention_worker())
+    asyncio.create_task(snapshot_rate_limits())
+    asyncio.create_task(flush_counters())
+
+    # Continue a broadcast interrupted by the last shutdown
+    from services.broadcast import broadcaster
+    await broadcaster.resume(bot)
 
     # Startup
     print("Bot started...")
-    await dp.start_polling(bot)
+    try:
+        if WEBHOOK_URL:
+            from webhook import run_webhook
+
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        from services.rate_limiter import rate_limiter
+        from services.counters import counters
+        from services.tts_cache import tts_cache
+
+        adb.close()
+        db.save_cooldowns(rate_limiter.snapshot())
+        counters.flush()
+        tts_cache.save()
+        db.close()
 
 
 if __name__ == "__main__":
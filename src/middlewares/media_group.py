@@ -1,10 +1,40 @@
 import asyncio
-from typing import Any, Callable, Dict, List
+import time
+from typing import Any, Callable, Dict, List, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, TelegramObject
 
-DEFAULT_LATENCY = 0.5
+# Quiet time after the last part before an album is considered complete
+DEFAULT_LATENCY = 0.3
+# Upper bound on collection time, however slowly the parts trickle in
+MAX_WAIT = 2.0
+# Telegram's album size limit; a full album is flushed immediately
+MAX_ALBUM_SIZE = 10
+# Albums collected at once per chat and overall; beyond that parts are
+# handled as single messages
+MAX_ALBUMS_PER_CHAT = 3
+MAX_ALBUMS = 1000
+
+
+class _Album:
+    __slots__ = (
+        "media_group_id",
+        "chat_id",
+        "messages",
+        "started",
+        "deadline",
+        "changed",
+    )
+
+    def __init__(self, event: Message, latency: float):
+        now = time.monotonic()
+        self.media_group_id = event.media_group_id
+        self.chat_id = event.chat.id
+        self.messages: List[Message] = [event]
+        self.started = now
+        self.deadline = now + latency
+        self.changed = asyncio.Event()
 
 
 class MediaGroupMiddleware(BaseMiddleware):
@@ -12,12 +42,23 @@ class MediaGroupMiddleware(BaseMiddleware):
     Middleware for collecting media groups.
     Each message in a media group is handled as a separate event by aiogram.
     This middleware collects them and passes a list of messages (as 'album') to the handler.
-    Wait for DEFAULT_LATENCY seconds for more messages with the same media_group_id.
+    The first part waits until no new part arrived for `latency` seconds (the
+    timer resets on every part), the album reaches 10 items, or MAX_WAIT passes.
+    The webhook and OrderedUpdatesMiddleware collect parts with
+    join/open/complete before updates reach the worker pool, so the wait
+    never holds a worker.
     """
 
-    def __init__(self, latency: float = DEFAULT_LATENCY):
+    def __init__(self, latency: float = DEFAULT_LATENCY, max_wait: float = MAX_WAIT):
         self.latency = latency
-        self.cache: Dict[str, List[Message]] = {}
+        self.max_wait = max_wait
+        self.cache: Dict[str, _Album] = {}
+        self._per_chat: Dict[int, int] = {}
+        # Collection delay metrics
+        self.albums = 0
+        self.early_flushes = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
         super().__init__()
 
     async def __call__(
@@ -26,21 +67,85 @@ class MediaGroupMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        if not isinstance(event, Message) or not event.media_group_id:
+        # "album" is already set when the parts were collected before
+        # dispatching (webhook and polling entry points)
+        if (
+            not isinstance(event, Message)
+            or not event.media_group_id
+            or "album" in data
+        ):
             return await handler(event, data)
 
-        mg_id = event.media_group_id
+        if self.join(event):
+            # Not the first message in the group: it was added, stop processing here
+            return None
+        album = self.open(event)
+        if album is not None:
+            data["album"] = await self.complete(album)
+        return await handler(event, data)
 
-        if mg_id not in self.cache:
-            self.cache[mg_id] = [event]
-            # Wait for all messages in the group to arrive
-            await asyncio.sleep(self.latency)
+    def join(self, event: Message) -> bool:
+        """Add a part to its album if that one is being collected."""
+        album = self.cache.get(event.media_group_id)
+        if album is None:
+            return False
+        album.messages.append(event)
+        album.deadline = time.monotonic() + self.latency
+        album.changed.set()
+        return True
 
-            # After waiting, trigger the handler with the full album
-            album = self.cache.pop(mg_id)
-            data["album"] = album
-            return await handler(event, data)
-        else:
-            # If this is not the first message in the group, just add it to the cache and stop processing here
-            self.cache[mg_id].append(event)
+    def open(self, event: Message) -> Optional[_Album]:
+        """Start collecting the album of a first part. Returns None when too
+        many albums are being collected; the part is then handled alone."""
+        chat_id = event.chat.id
+        if (
+            len(self.cache) >= MAX_ALBUMS
+            or self._per_chat.get(chat_id, 0) >= MAX_ALBUMS_PER_CHAT
+        ):
             return None
+        album = self.cache[event.media_group_id] = _Album(event, self.latency)
+        self._per_chat[chat_id] = self._per_chat.get(chat_id, 0) + 1
+        return album
+
+    async def complete(self, album: _Album) -> List[Message]:
+        """Wait until an opened album is complete and return its parts in order."""
+        try:
+            await self._collect(album)
+        finally:
+            self.cache.pop(album.media_group_id, None)
+            left = self._per_chat.pop(album.chat_id, 1) - 1
+            if left > 0:
+                self._per_chat[album.chat_id] = left
+
+        delay = time.monotonic() - album.started
+        self.albums += 1
+        self.total_delay += delay
+        self.max_delay = max(self.max_delay, delay)
+        return sorted(album.messages, key=lambda m: m.message_id)
+
+    async def _collect(self, album: _Album):
+        """Wait until the album is complete."""
+        hard_deadline = album.started + self.max_wait
+        while len(album.messages) < MAX_ALBUM_SIZE:
+            timeout = min(album.deadline, hard_deadline) - time.monotonic()
+            if timeout <= 0:
+                return
+            album.changed.clear()
+            try:
+                await asyncio.wait_for(album.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.early_flushes += 1
+
+    def stats(self) -> dict:
+        """Album collection metrics."""
+        return {
+            "collecting": len(self.cache),
+            "albums": self.albums,
+            "early_flushes": self.early_flushes,
+            "avg_delay": self.total_delay / self.albums if self.albums else 0.0,
+            "max_delay": self.max_delay,
+        }
+
+
+media_group = MediaGroupMiddleware()
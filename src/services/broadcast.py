@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from config import BROADCAST_PAGE_SIZE
+from database import adb
+from services.send_scheduler import send_scheduler, Priority
+
+
+class Broadcaster:
+    """Copies one admin message to every user in user_settings.
+
+    Recipients are streamed in pages by user_id (keyset pagination), each page
+    is handed to the send scheduler at broadcast priority so regular traffic
+    still goes first, and the cursor is saved after every page. A broadcast
+    interrupted by a restart continues from its last saved page.
+    """
+
+    def __init__(self, page_size: int = BROADCAST_PAGE_SIZE):
+        self.page_size = max(1, page_size)
+        self.current = None  # row of the running broadcast
+        self._task = None
+        self._started_at = 0.0
+        self._done_this_run = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, from_chat_id: int, message_id: int) -> bool:
+        """Begin a new broadcast. Returns False if one is already running."""
+        if self.running:
+            return False
+        if await adb.create_broadcast(from_chat_id, message_id) is None:
+            return False
+        return await self.resume(bot)
+
+    async def resume(self, bot: Bot) -> bool:
+        """Continue the unfinished broadcast, if any (called on startup)."""
+        if self.running:
+            return False
+        row = await adb.get_running_broadcast()
+        if not row:
+            return False
+        if row["last_user_id"]:
+            logging.info(
+                f"Resuming broadcast {row['id']} after user {row['last_user_id']}"
+            )
+        self.current = row
+        self._started_at = time.monotonic()
+        self._done_this_run = 0
+        self._task = asyncio.create_task(self._run(bot, row))
+        return True
+
+    async def _run(self, bot: Bot, b: dict):
+        try:
+            while True:
+                users = await adb.get_broadcast_recipients(
+                    b["last_user_id"], self.page_size
+                )
+                if not users:
+                    break
+                errors = await asyncio.gather(
+                    *(self._send_one(bot, b, user_id) for user_id in users)
+                )
+                failures = [(u, err) for u, err in zip(users, errors) if err]
+                sent = len(users) - len(failures)
+                await adb.save_broadcast_progress(b["id"], users[-1], sent, failures)
+                b["last_user_id"] = users[-1]
+                b["sent"] += sent
+                b["failed"] += len(failures)
+                self._done_this_run += len(users)
+
+            await adb.finish_broadcast(b["id"])
+            logging.info(
+                f"Broadcast {b['id']} finished: {b['sent']} sent, {b['failed']} failed"
+            )
+            self.current = None
+        except Exception as e:
+            # Left as 'running' in the database, so it resumes on next start
+            logging.error(f"Broadcast {b['id']} stopped: {e}")
+
+    async def _send_one(self, bot: Bot, b: dict, user_id: int) -> Optional[str]:
+        """Send to one recipient. Returns an error string on failure."""
+        try:
+            await send_scheduler.send(
+                user_id,
+                lambda: bot.copy_message(
+                    chat_id=user_id,
+                    from_chat_id=b["from_chat_id"],
+                    message_id=b["message_id"],
+                ),
+                Priority.BROADCAST,
+            )
+            return None
+        except TelegramForbiddenError:
+            return "blocked"
+        except Exception as e:
+            return str(e)[:200]
+
+    def progress(self) -> Optional[dict]:
+        """Live progress of the running broadcast, or None."""
+        b = self.current
+        if not b or not self.running:
+            return None
+        done = b["sent"] + b["failed"]
+        total = max(b["total"], done)
+        elapsed = time.monotonic() - self._started_at
+        rate = self._done_this_run / elapsed if elapsed > 0 else 0.0
+        return {
+            "id": b["id"],
+            "done": done,
+            "total": total,
+            "failed": b["failed"],
+            "rate": rate,
+            "eta": (total - done) / rate if rate > 0 else None,
+        }
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,73 @@
+import threading
+from datetime import datetime
+from typing import Dict
+
+from database import db, Database
+
+SHARDS = 8
+
+
+class Counters:
+    """Atomic usage counters kept in memory and flushed in batches.
+
+    incr() only takes the lock of the counter's shard, so it is cheap and
+    safe from any thread. flush() writes all accumulated deltas to the
+    counters table in a single transaction.
+    """
+
+    def __init__(self, database: Database):
+        self._db = database
+        self._shards = [(threading.Lock(), {}) for _ in range(SHARDS)]
+        self._flush_lock = threading.Lock()
+        # Values already persisted, loaded once at startup
+        self._base: Dict[str, int] = dict(database.load_counters())
+
+    def _shard(self, name: str):
+        return self._shards[hash(name) % SHARDS]
+
+    def incr(self, name: str, amount: int = 1) -> int:
+        """Add `amount` to a counter and return its new value."""
+        lock, pending = self._shard(name)
+        with lock:
+            pending[name] = pending.get(name, 0) + amount
+            return self._base.get(name, 0) + pending[name]
+
+    def get(self, name: str) -> int:
+        lock, pending = self._shard(name)
+        with lock:
+            return self._base.get(name, 0) + pending.get(name, 0)
+
+    @staticmethod
+    def monthly(name: str, when: datetime = None) -> str:
+        """Name of the current month's instance of a counter."""
+        return f"{name}_{(when or datetime.now()).strftime('%Y_%m')}"
+
+    def _move(self, deltas: Dict[str, int], sign: int):
+        """Move deltas between pending (unsaved) and base (saved) values."""
+        for name, amount in deltas.items():
+            lock, pending = self._shard(name)
+            with lock:
+                pending[name] = pending.get(name, 0) - sign * amount
+                if not pending[name]:
+                    del pending[name]
+                self._base[name] = self._base.get(name, 0) + sign * amount
+
+    def flush(self):
+        """Persist pending deltas. On failure they are kept for the next flush."""
+        with self._flush_lock:
+            deltas: Dict[str, int] = {}
+            for lock, pending in self._shards:
+                with lock:
+                    deltas.update(pending)
+            if not deltas:
+                return
+            # Counted as saved first, so readers never see a value twice
+            self._move(deltas, 1)
+            try:
+                self._db.add_counters(deltas)
+            except Exception:
+                self._move(deltas, -1)
+                raise
+
+
+counters = Counters(db)
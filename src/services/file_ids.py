@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from database import adb
+
+
+def content_key(path: str) -> str:
+    """Hash of a local file's bytes, so identical clips and cards share an id."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_stale_file_id(error: TelegramBadRequest) -> bool:
+    """True if Telegram rejected the file_id itself, not the rest of the request."""
+    message = error.message.lower()
+    return "file identifier" in message or "file reference" in message
+
+
+def sent_file_id(message: Message, media_type: str) -> Optional[str]:
+    """file_id Telegram assigned to the media of a sent message."""
+    if media_type == "photo":
+        return message.photo[-1].file_id if message.photo else None
+    media = getattr(message, media_type, None)
+    return media.file_id if media else None
+
+
+async def send_cached(
+    path: str,
+    media_type: str,
+    send: Callable[[Union[str, FSInputFile]], Awaitable[Message]],
+) -> Message:
+    """Send a local file via `send(media)`, by file_id if it was uploaded
+    before. The first upload's file_id is remembered (retention drops it
+    after RETENTION_FILE_ID_DAYS); an id Telegram rejects is forgotten and
+    the file is uploaded again."""
+    # Reading and hashing the whole file must not block the event loop
+    key = await asyncio.to_thread(content_key, path)
+    file_id = await adb.get_media_file_id(key, media_type)
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            if not is_stale_file_id(e):
+                raise
+            logging.warning(f"Cached file_id rejected, uploading again: {e}")
+            await adb.delete_media_file_id(key, media_type)
+
+    sent = await send(FSInputFile(path))
+    new_id = sent_file_id(sent, media_type) if sent else None
+    if new_id:
+        await adb.save_media_file_id(key, media_type, new_id)
+    return sent
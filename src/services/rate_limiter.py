@@ -0,0 +1,117 @@
+import math
+import time
+from typing import Dict, Tuple
+
+from config import RATE_LIMIT_SENDER_PER_MIN, RATE_LIMIT_GLOBAL_PER_SEC
+from database import db
+
+
+class GCRA:
+    """Generic cell rate algorithm: `rate` events per `period` seconds,
+    allowing bursts of up to `burst` events. State is one timestamp (the
+    theoretical arrival time) per key, dropped lazily once it is in the past."""
+
+    def __init__(self, rate: int, period: float, burst: int = None):
+        self.enabled = rate > 0
+        self.interval = period / rate if self.enabled else 0.0
+        self.tolerance = self.interval * ((burst or rate) - 1)
+        self._tat: Dict[object, float] = {}
+
+    def peek(self, key, now: float) -> float:
+        """Seconds until `key` may pass again (0 if it may pass now)."""
+        if not self.enabled:
+            return 0.0
+        tat = self._tat.get(key)
+        if tat is None:
+            return 0.0
+        if tat <= now:
+            del self._tat[key]
+            return 0.0
+        return max(0.0, tat - self.tolerance - now)
+
+    def reserve(self, key, now: float):
+        if self.enabled:
+            self._tat[key] = max(self._tat.get(key, now), now) + self.interval
+
+    def sweep(self, now: float):
+        self._tat = {k: tat for k, tat in self._tat.items() if tat > now}
+
+
+class RateLimiter:
+    """In-memory replacement for the cooldowns table.
+
+    Three limits are checked together: the per-pair cooldown (the admin's
+    message_cooldown), an optional per-sender rate and an optional global
+    rate. check() has no awaits, so a check-and-reserve is atomic on the
+    event loop. Pair cooldowns are snapshotted to the database periodically
+    so a restart doesn't reset them.
+    """
+
+    def __init__(
+        self,
+        pair_cooldown: int = 0,
+        sender_per_min: int = RATE_LIMIT_SENDER_PER_MIN,
+        global_per_sec: int = RATE_LIMIT_GLOBAL_PER_SEC,
+    ):
+        self.pair_cooldown = pair_cooldown
+        # (sender_id, receiver_id) -> time of the last allowed message
+        self._pair_last: Dict[Tuple[int, int], float] = {}
+        self._sender = GCRA(sender_per_min, 60.0)
+        self._global = GCRA(global_per_sec, 1.0)
+
+    def set_pair_cooldown(self, seconds: int):
+        self.pair_cooldown = max(0, int(seconds))
+
+    def _pair_wait(self, key, now: float) -> float:
+        last = self._pair_last.get(key)
+        if last is None:
+            return 0.0
+        wait = last + self.pair_cooldown - now
+        if wait <= 0:
+            del self._pair_last[key]
+            return 0.0
+        return wait
+
+    def check(self, sender_id: int, receiver_id: int) -> Tuple[bool, int]:
+        """Check all limits and reserve a slot if allowed.
+        Returns (is_allowed, remaining_seconds)."""
+        now = time.time()
+        pair = (sender_id, receiver_id)
+        wait = max(
+            self._pair_wait(pair, now) if self.pair_cooldown > 0 else 0.0,
+            self._sender.peek(sender_id, now),
+            self._global.peek(None, now),
+        )
+        if wait > 0:
+            return False, max(1, math.ceil(wait))
+
+        if self.pair_cooldown > 0:
+            self._pair_last[pair] = now
+        self._sender.reserve(sender_id, now)
+        self._global.reserve(None, now)
+        return True, 0
+
+    def sweep(self):
+        """Drop every entry whose limit has already expired."""
+        now = time.time()
+        self._pair_last = {
+            k: last
+            for k, last in self._pair_last.items()
+            if last + self.pair_cooldown > now
+        }
+        self._sender.sweep(now)
+        self._global.sweep(now)
+
+    def snapshot(self):
+        """Rows (sender_id, receiver_id, last_sent_epoch) of active pair cooldowns."""
+        self.sweep()
+        return [(s, r, int(last)) for (s, r), last in self._pair_last.items()]
+
+    def restore(self, rows):
+        for sender_id, receiver_id, last_sent in rows:
+            self._pair_last[(sender_id, receiver_id)] = float(last_sent)
+
+
+rate_limiter = RateLimiter(db.config.get("message_cooldown"))
+rate_limiter.restore(db.load_cooldowns())
+db.config.subscribe("message_cooldown", rate_limiter.set_pair_cooldown)
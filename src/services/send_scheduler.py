@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    SEND_PER_CHAT_RATE,
+    SEND_PER_CHAT_BURST,
+    SEND_GLOBAL_RATE,
+    SEND_MAX_IN_FLIGHT,
+)
+
+# Retries of a single job after TelegramRetryAfter before giving up
+MAX_RETRY_AFTER = 3
+# Idle chats keep their bucket this long before being forgotten (seconds)
+CHAT_IDLE_TTL = 60
+
+
+class Priority(IntEnum):
+    """Lower value is sent first."""
+
+    REPLY = 0
+    MESSAGE = 1
+    NOTIFICATION = 2
+    CONFIRMATION = 3
+    BROADCAST = 4
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "factory", "future", "attempts")
+
+    def __init__(self, priority: int, seq: int, factory, future):
+        self.priority = priority
+        self.seq = seq
+        self.factory = factory
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Chat:
+    __slots__ = ("jobs", "bucket", "busy", "blocked_until", "timer")
+
+    def __init__(self, rate: float, burst: float):
+        self.jobs = []  # heap of _Job
+        self.bucket = TokenBucket(rate, burst)
+        self.busy = False
+        self.blocked_until = 0.0
+        self.timer = None
+
+
+class SendScheduler:
+    """Central queue for outbound Bot API calls.
+
+    Each chat has its own token bucket and sends at most one request at a
+    time, so messages to a chat keep their order. Across chats the job with
+    the best priority goes first, within a global rate budget. A
+    TelegramRetryAfter pauses only the affected chat and the job is retried
+    at the head of its queue.
+
+    Usage: `await send_scheduler.send(chat_id, lambda: bot.send_message(...))`.
+    The factory is called again on retry, so it must build a fresh request.
+    """
+
+    def __init__(
+        self,
+        per_chat_rate: float = SEND_PER_CHAT_RATE,
+        per_chat_burst: float = SEND_PER_CHAT_BURST,
+        global_rate: float = SEND_GLOBAL_RATE,
+        max_in_flight: int = SEND_MAX_IN_FLIGHT,
+    ):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.max_in_flight = max_in_flight
+        self._chats: Dict[int, _Chat] = {}
+        self._ready = []  # heap of (priority, seq, chat_id)
+        self._seq = itertools.count()
+        self._depth = {p: 0 for p in Priority}
+        self._in_flight = 0
+        self._wakeup = None
+        self._slots = None
+        self._dispatcher = None
+        self._last_sweep = time.monotonic()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def send(
+        self,
+        chat_id: int,
+        factory: Callable[[], Awaitable],
+        priority: Priority = Priority.MESSAGE,
+    ):
+        """Queue a request for `chat_id` and wait for its result."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(int(priority), next(self._seq), factory, future)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self.per_chat_rate, self.per_chat_burst)
+        heapq.heappush(chat.jobs, job)
+        self._depth[Priority(job.priority)] += 1
+        self._activate(chat_id, chat)
+        return await future
+
+    def _activate(self, chat_id: int, chat: _Chat):
+        """Mark a chat as ready, or set a timer for when it will be."""
+        if chat.busy or chat.timer or not chat.jobs:
+            return
+        now = time.monotonic()
+        wait = max(chat.blocked_until - now, chat.bucket.wait_time(now))
+        if wait > 0:
+            chat.timer = asyncio.get_running_loop().call_later(
+                wait, self._on_timer, chat_id
+            )
+            return
+        head = chat.jobs[0]
+        heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        self._wakeup.set()
+
+    def _on_timer(self, chat_id: int):
+        chat = self._chats.get(chat_id)
+        if chat:
+            chat.timer = None
+            self._activate(chat_id, chat)
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._ready:
+                wait = self.global_bucket.wait_time(time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                await self._slots.acquire()
+                if not self._ready:
+                    self._slots.release()
+                    break
+                priority, seq, chat_id = heapq.heappop(self._ready)
+                chat = self._chats.get(chat_id)
+                # Entries go stale when a better job arrived for the same chat
+                if (
+                    chat is None
+                    or chat.busy
+                    or not chat.jobs
+                    or chat.jobs[0].seq != seq
+                ):
+                    self._slots.release()
+                    continue
+                now = time.monotonic()
+                chat.bucket.consume(now)
+                self.global_bucket.consume(now)
+                job = heapq.heappop(chat.jobs)
+                self._depth[Priority(job.priority)] -= 1
+                chat.busy = True
+                self._in_flight += 1
+                asyncio.create_task(self._execute(chat_id, chat, job))
+            self._sweep()
+
+    async def _execute(self, chat_id: int, chat: _Chat, job: _Job):
+        try:
+            result = await job.factory()
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            chat.blocked_until = time.monotonic() + e.retry_after
+            if job.attempts <= MAX_RETRY_AFTER:
+                self.retried += 1
+                logging.warning(
+                    f"Flood limit for chat {chat_id}: retry in {e.retry_after}s"
+                )
+                heapq.heappush(chat.jobs, job)
+                self._depth[Priority(job.priority)] += 1
+                return
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            chat.busy = False
+            self._in_flight -= 1
+            self._slots.release()
+            self._activate(chat_id, chat)
+
+    def _sweep(self):
+        """Forget idle chats whose bucket has fully refilled."""
+        now = time.monotonic()
+        if now - self._last_sweep < CHAT_IDLE_TTL:
+            return
+        self._last_sweep = now
+        for chat_id, chat in list(self._chats.items()):
+            if (
+                not chat.jobs
+                and not chat.busy
+                and not chat.timer
+                and chat.blocked_until < now
+                and chat.bucket.is_full(now)
+            ):
+                del self._chats[chat_id]
+
+    def metrics(self) -> dict:
+        """Queue depth per priority and delivery counters."""
+        return {
+            "queued": {p.name.lower(): n for p, n in self._depth.items()},
+            "in_flight": self._in_flight,
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+send_scheduler = SendScheduler()
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from config import TTS_CACHE_DIR, TTS_CACHE_MAX_MB, TTS_CACHE_GRACE
+
+INDEX_FILE = "index.json"
+# Minimum time between index writes triggered by put() (seconds). Hits only
+# mark the index dirty; their counts are written by the next put or save()
+INDEX_SAVE_INTERVAL = 30
+# Eviction looks at this many least recently used entries and drops the
+# one with the fewest hits, so popular clips survive a scan of one-offs
+EVICTION_SAMPLE = 8
+
+
+def normalize_text(text: str) -> str:
+    """Text as it affects the synthesized audio: NFC, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class _Entry:
+    __slots__ = ("size", "last_access", "hits")
+
+    def __init__(self, size: int, last_access: float, hits: int = 0):
+        self.size = size
+        self.last_access = last_access
+        self.hits = hits
+
+
+class TTSCache:
+    """Size-bounded cache of synthesized clips on disk.
+
+    An in-memory index (size, last access, hits per key, in LRU order) is
+    mirrored to a JSON sidecar so it survives restarts; files without an
+    index entry (e.g. from older versions) are adopted on load. Files are
+    written to a temp name and renamed, so a crash never leaves a partial
+    clip under a valid key.
+
+    Hits are served straight from the cache file. Callers must not delete
+    such paths (check owns()), and entries used within the last `grace`
+    seconds are never evicted, so a clip stays in place while its preview
+    waits for confirmation.
+    """
+
+    def __init__(
+        self,
+        directory: str = TTS_CACHE_DIR,
+        max_bytes: int = TTS_CACHE_MAX_MB * 1024 * 1024,
+        grace: float = TTS_CACHE_GRACE,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+        self._saved_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(text: str, voice: str, pitch: str, rate: str, anonymize: bool) -> str:
+        unique_string = f"{normalize_text(text)}_{voice}_{pitch}_{rate}_{anonymize}"
+        return hashlib.md5(unique_string.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def owns(self, path: str) -> bool:
+        """True if `path` is a cached clip (which must not be deleted)."""
+        return os.path.dirname(os.path.abspath(path)) == self.directory
+
+    def _load(self):
+        index = {}
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"TTS cache index unreadable, rebuilding: {e}")
+
+        entries = []
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext != ".mp3":
+                if name.endswith(".tmp"):
+                    # Leftover of an interrupted write
+                    os.remove(os.path.join(self.directory, name))
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            _, last_access, hits = index.get(key, (stat.st_size, stat.st_mtime, 0))
+            entries.append((last_access, key, _Entry(stat.st_size, last_access, hits)))
+
+        for _, key, entry in sorted(entries):
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+        self._dirty = len(entries) != len(index)
+        self._evict()
+        self.save()
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached clip, or None on a miss."""
+        entry = self._entries.get(key)
+        path = self.path(key)
+        if entry is None or not os.path.exists(path):
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        entry.last_access = time.time()
+        entry.hits += 1
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # No disk write on the hit path
+        self._dirty = True
+        return path
+
+    def put(self, key: str, source_path: str) -> Optional[str]:
+        """Copy a freshly generated clip into the cache. Returns its path."""
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to save to cache: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old.size
+        entry = _Entry(os.path.getsize(path), time.time())
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        self._evict()
+        self._dirty = True
+        self._maybe_save()
+        return path
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        self._dirty = True
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to evict TTS clip {key}: {e}")
+
+    def _evict(self):
+        protected_after = time.time() - self.grace
+        while self.total_bytes > self.max_bytes:
+            sample = []
+            for position, (key, entry) in enumerate(self._entries.items()):
+                # LRU order: everything from here on was used recently
+                if entry.last_access > protected_after:
+                    break
+                sample.append((entry.hits, position, key))
+                if len(sample) >= EVICTION_SAMPLE:
+                    break
+            if not sample:
+                return
+            _, _, victim = min(sample)
+            self._drop(victim)
+            self.evictions += 1
+
+    def _maybe_save(self):
+        if self._dirty and time.time() - self._saved_at > INDEX_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """Write the index sidecar atomically."""
+        tmp_path = f"{self.index_path}.tmp"
+        index = {
+            key: (e.size, e.last_access, e.hits) for key, e in self._entries.items()
+        }
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+            self._saved_at = time.time()
+        except OSError as e:
+            logging.error(f"Failed to save TTS cache index: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+tts_cache = TTSCache()
@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+import edge_tts
+
+try:
+    import azure.cognitiveservices.speech as speechsdk
+except ImportError:
+    speechsdk = None
+
+from config import (
+    AZURE_SPEECH_KEY,
+    AZURE_SPEECH_REGION,
+    TTS_PROVIDERS,
+    TTS_PROVIDER_TIMEOUT,
+    TTS_BREAKER_FAILURES,
+    TTS_BREAKER_COOLDOWN,
+)
+from services.counters import counters
+
+# 480k characters limit (Azure Free Tier is 500k/mo)
+AZURE_MONTHLY_LIMIT = 480000
+
+# Results remembered per provider for latency and error rate
+HEALTH_WINDOW = 20
+# Providers within this factor of the fastest one keep their configured
+# order; latencies below the floor (seconds) count as the floor
+LATENCY_SLACK = 2.0
+LATENCY_FLOOR = 0.25
+# A provider with less than this share of its quota left is used last
+QUOTA_RESERVE = 0.1
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """No provider could synthesize the text."""
+
+
+class Health:
+    """Rolling latency and error rate of a provider, plus its circuit breaker.
+
+    The breaker opens after `failures` failures in a row (or when half of a
+    full window failed) and rejects calls for `cooldown` seconds. Then one
+    probe call is let through (half-open): success closes the breaker,
+    failure opens it again.
+    """
+
+    def __init__(
+        self,
+        window: int = HEALTH_WINDOW,
+        failures: int = TTS_BREAKER_FAILURES,
+        cooldown: float = TTS_BREAKER_COOLDOWN,
+    ):
+        self.results = deque(maxlen=window)
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allows(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return True
+
+    def begin(self):
+        if self.state == HALF_OPEN:
+            self.probing = True
+
+    def end(self):
+        """Free the probe slot of a call that ended without record(), e.g.
+        because it was cancelled; otherwise no probe would ever run again."""
+        self.probing = False
+
+    def record(self, ok: bool, seconds: float):
+        self.results.append((ok, seconds))
+        self.probing = False
+        if ok:
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            return
+        self.consecutive_failures += 1
+        window_failed = (
+            len(self.results) == self.results.maxlen and self.error_rate >= 0.5
+        )
+        if (
+            self.state == HALF_OPEN
+            or self.consecutive_failures >= self.failures
+            or window_failed
+        ):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return sum(1 for ok, _ in self.results if not ok) / len(self.results)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Mean latency of recent successful calls, None before the first."""
+        times = [seconds for ok, seconds in self.results if ok]
+        return sum(times) / len(times) if times else None
+
+
+class TTSProvider:
+    """A speech backend. synthesize() writes an mp3 to `path` or raises."""
+
+    name = ""
+    # Assumed latency (seconds) until real calls have been measured
+    expected_latency = 1.0
+
+    def __init__(self):
+        self.health = Health()
+
+    def available(self) -> bool:
+        return True
+
+    def quota_left(self) -> Optional[int]:
+        """Characters left this period, None if unlimited."""
+        return None
+
+    def quota_total(self) -> Optional[int]:
+        return None
+
+    def charge(self, chars: int):
+        """Account a successful synthesis against the quota."""
+
+    async def synthesize(self, text: str, voice_config: dict, path: str):
+        raise NotImplementedError
+
+    def score(self) -> float:
+        """Expected time to a successful result, failed attempts included."""
+        latency = self.health.latency
+        if latency is None:
+            latency = self.expected_latency
+        return latency / max(0.1, 1 - self.health.error_rate)
+
+
+class AzureProvider(TTSProvider):
+    """Azure Cognitive Services, limited to AZURE_MONTHLY_LIMIT characters."""
+
+    name = "azure"
+    expected_latency = 1.5
+
+    def available(self) -> bool:
+        return bool(speechsdk and AZURE_SPEECH_KEY and AZURE_SPEECH_REGION)
+
+    def quota_left(self) -> Optional[int]:
+        return AZURE_MONTHLY_LIMIT - counters.get(counters.monthly("speech_usage"))
+
+    def quota_total(self) -> Optional[int]:
+        return AZURE_MONTHLY_LIMIT
+
+    def charge(self, chars: int):
+        counters.incr(counters.monthly("speech_usage"), chars)
+
+    async def synthesize(self, text: str, voice_config: dict, path: str):
+        await generate_azure_speech(text, voice_config, path)
+
+
+class EdgeProvider(TTSProvider):
+    """Free Edge TTS service."""
+
+    name = "edge"
+
+    def __init__(self, concurrency: int = 3):
+        super().__init__()
+        # Limit simultaneous requests to avoid being blocked
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def synthesize(self, text: str, voice_config: dict, path: str):
+        async with self.semaphore:
+            communicate = edge_tts.Communicate(
+                text,
+                voice_config["voice"],
+                pitch=voice_config["pitch"],
+                rate=voice_config["rate"],
+            )
+            await communicate.save(path)
+
+
+# One second of silence: 38 MPEG-1 Layer III frames (32 kbps, 44.1 kHz, mono)
+_SILENT_FRAME = b"\xff\xfb\x10\xc4" + bytes(100)
+
+
+class StubProvider(TTSProvider):
+    """Offline provider writing silence, for tests and local runs.
+    `delay` and `fail` simulate a slow or broken backend."""
+
+    name = "stub"
+    expected_latency = 0.0
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def synthesize(self, text: str, voice_config: dict, path: str):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} stub failure")
+        seconds = min(30, 1 + len(text) // 15)
+        with open(path, "wb") as f:
+            f.write(_SILENT_FRAME * 38 * seconds)
+
+
+PROVIDERS = {"azure": AzureProvider, "edge": EdgeProvider, "stub": StubProvider}
+
+
+class TTSRouter:
+    """Picks a provider per request from the configured ones.
+
+    Candidates are the available providers whose breaker is closed (or
+    ready for a probe) and whose quota covers the text. They are tried in
+    the configured order, except that providers much slower than the
+    fastest (by observed latency and error rate) or close to the end of
+    their quota move to the back. Each call is bounded by `timeout`, so a
+    hanging backend costs one timeout instead of a retry cycle.
+    """
+
+    def __init__(
+        self, providers: List[TTSProvider], timeout: float = TTS_PROVIDER_TIMEOUT
+    ):
+        self.providers = providers
+        self.timeout = timeout
+
+    def candidates(self, chars: int) -> List[TTSProvider]:
+        ready = []
+        for provider in self.providers:
+            if not provider.available() or not provider.health.allows():
+                continue
+            left = provider.quota_left()
+            if left is not None and left < chars:
+                continue
+            ready.append(provider)
+        if not ready:
+            return []
+
+        threshold = max(LATENCY_FLOOR, min(p.score() for p in ready)) * LATENCY_SLACK
+
+        def rank(item):
+            position, provider = item
+            left, total = provider.quota_left(), provider.quota_total()
+            low_quota = (
+                left is not None and bool(total) and left < total * QUOTA_RESERVE
+            )
+            too_slow = provider.score() > threshold
+            return (too_slow, low_quota, position)
+
+        return [p for _, p in sorted(enumerate(ready), key=rank)]
+
+    async def _call(self, provider: TTSProvider, text: str, voice_config, path):
+        """One bounded call. The provider writes to a file of its own that is
+        moved onto `path` only on success: a call still running after its
+        timeout (Azure carries on in an executor thread) can't overwrite what
+        the next provider produced."""
+        attempt_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await asyncio.wait_for(
+                provider.synthesize(text, voice_config, attempt_path), self.timeout
+            )
+            os.replace(attempt_path, path)
+        finally:
+            if os.path.exists(attempt_path):
+                try:
+                    os.remove(attempt_path)
+                except OSError:
+                    pass
+
+    async def _try_fallback(
+        self, provider: TTSProvider, text: str, voice_config, fallback, path
+    ) -> bool:
+        """Retry a rejected request with the fallback voice on the same
+        provider. Success means the voice was at fault, not the provider."""
+        if not fallback or fallback == voice_config:
+            return False
+        try:
+            await self._call(provider, text, fallback, path)
+        except Exception:
+            return False
+        logging.warning(
+            f"Voice {voice_config['voice']} failed on {provider.name}, "
+            f"used {fallback['voice']}"
+        )
+        return True
+
+    async def _attempt(
+        self, provider: TTSProvider, text: str, voice_config, fallback, path
+    ) -> Optional[Exception]:
+        """One try on `provider`, recorded in its health. Returns the error,
+        or None on success."""
+        started = time.monotonic()
+        try:
+            await self._call(provider, text, voice_config, path)
+        except Exception as e:
+            # A timeout is the provider's fault whatever the voice
+            if isinstance(e, asyncio.TimeoutError) or not await self._try_fallback(
+                provider, text, voice_config, fallback, path
+            ):
+                provider.health.record(False, time.monotonic() - started)
+                logging.warning(f"TTS provider {provider.name} failed: {e!r}")
+                return e
+        provider.health.record(True, time.monotonic() - started)
+        return None
+
+    async def synthesize(
+        self,
+        text: str,
+        voice_config: dict,
+        path: str,
+        attempts: int = 3,
+        fallback: dict = None,
+    ) -> TTSProvider:
+        """Write speech for `text` to `path` and return the provider that did.
+        Raises ProviderUnavailable when every attempt failed.
+
+        A provider that rejects `voice_config` (e.g. a user's custom voice)
+        but synthesizes `fallback` is healthy: the fallback audio is kept and
+        no failure is recorded, so bad input can't open a breaker."""
+        tried = {}
+        last_error = None
+        for _ in range(max(1, attempts)):
+            candidates = self.candidates(len(text))
+            if not candidates:
+                break
+            # Spread attempts over providers before retrying one
+            provider = min(candidates, key=lambda p: tried.get(p.name, 0))
+            tried[provider.name] = tried.get(provider.name, 0) + 1
+
+            provider.health.begin()
+            try:
+                error = await self._attempt(
+                    provider, text, voice_config, fallback, path
+                )
+            finally:
+                provider.health.end()
+            if error is None:
+                provider.charge(len(text))
+                return provider
+            last_error = error
+
+        raise ProviderUnavailable(f"No TTS provider succeeded: {last_error!r}")
+
+    def stats(self) -> dict:
+        return {
+            p.name: {
+                "available": p.available(),
+                "state": p.health.state,
+                "latency_ms": (
+                    p.health.latency * 1000 if p.health.latency is not None else None
+                ),
+                "error_rate": p.health.error_rate,
+                "quota_left": p.quota_left(),
+            }
+            for p in self.providers
+        }
+
+
+def build_providers(names: str = TTS_PROVIDERS) -> List[TTSProvider]:
+    providers = []
+    for name in (n.strip().lower() for n in names.split(",")):
+        if not name:
+            continue
+        if name not in PROVIDERS:
+            logging.warning(f"Unknown TTS provider in TTS_PROVIDERS: {name}")
+            continue
+        providers.append(PROVIDERS[name]())
+    return providers or [EdgeProvider()]
+
+
+async def generate_azure_speech(text: str, voice_config: dict, output_path: str):
+    """Generate speech using Azure Cognitive Services SDK."""
+    if not speechsdk:
+        raise ImportError("Azure Speech SDK not installed")
+
+    speech_config = speechsdk.SpeechConfig(
+        subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION
+    )
+    # Set voice directly
+    speech_config.speech_synthesis_voice_name = voice_config["voice"]
+
+    # Configure output to file
+    audio_config = speechsdk.audio.AudioOutputConfig(filename=output_path)
+
+    synthesizer = speechsdk.SpeechSynthesizer(
+        speech_config=speech_config, audio_config=audio_config
+    )
+
+    # Note: Azure SDK doesn't support pitch/rate modification directly via simple synthesis
+    # unless using SSML. We will use SSML for consistent feature support.
+    ssml = f"""
+    <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="uk-UA">
+        <voice name="{voice_config["voice"]}">
+            <prosody pitch="{voice_config["pitch"]}" rate="{voice_config["rate"]}">
+                {text}
+            </prosody>
+        </voice>
+    </speak>
+    """
+
+    # Run in executor to avoid blocking async loop (run_in_executor needed for sync SDK methods)
+    loop = asyncio.get_running_loop()
+
+    def _synthesize():
+        result = synthesizer.speak_ssml_async(ssml).get()
+        return result
+
+    result = await loop.run_in_executor(None, _synthesize)
+
+    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+        pass
+    elif result.reason == speechsdk.ResultReason.Canceled:
+        cancellation_details = result.cancellation_details
+        error_msg = f"Azure Speech canceled: {cancellation_details.reason}"
+        if cancellation_details.reason == speechsdk.CancellationReason.Error:
+            error_msg += f" Error details: {cancellation_details.error_details}"
+        raise Exception(error_msg)
+
+
+tts_router = TTSRouter(build_providers())
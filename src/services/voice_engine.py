@@ -1,28 +1,20 @@
-import edge_tts
 import os
 import uuid
 import asyncio
 import logging
 import random
-import hashlib
 import shutil
-from datetime import datetime
 from typing import Union
 from aiogram.types import FSInputFile
 
-try:
-    import azure.cognitiveservices.speech as speechsdk
-except ImportError:
-    speechsdk = None
+from services.tts_cache import tts_cache
+from services.tts_providers import tts_router
 
-from database import db
-from config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION
+# Syntheses in progress by cache key, so identical concurrent requests share one
+_in_flight = {}
 
-# Limit simultaneous requests to avoid being blocked
-semaphore = asyncio.Semaphore(3)
-
-# 480k characters limit (Azure Free Tier is 500k/mo)
-AZURE_MONTHLY_LIMIT = 480000
+# Used when a provider rejects a custom voice (or pitch/rate)
+SAFE_VOICE = {"voice": "uk-UA-OstapNeural", "pitch": "+0Hz", "rate": "+0%"}
 
 VOICES = {
     # Azure Voices
@@ -53,59 +45,6 @@ VOICES = {
 }
 
 
-def get_month_key():
-    return datetime.now().strftime("speech_usage_%Y_%m")
-
-
-async def generate_azure_speech(text: str, voice_config: dict, output_path: str):
-    """Generate speech using Azure Cognitive Services SDK."""
-    if not speechsdk:
-        raise ImportError("Azure Speech SDK not installed")
-
-    speech_config = speechsdk.SpeechConfig(
-        subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION
-    )
-    # Set voice directly
-    speech_config.speech_synthesis_voice_name = voice_config["voice"]
-
-    # Configure output to file
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=output_path)
-
-    synthesizer = speechsdk.SpeechSynthesizer(
-        speech_config=speech_config, audio_config=audio_config
-    )
-
-    # Note: Azure SDK doesn't support pitch/rate modification directly via simple synthesis
-    # unless using SSML. We will use SSML for consistent feature support.
-    ssml = f"""
-    <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="uk-UA">
-        <voice name="{voice_config["voice"]}">
-            <prosody pitch="{voice_config["pitch"]}" rate="{voice_config["rate"]}">
-                {text}
-            </prosody>
-        </voice>
-    </speak>
-    """
-
-    # Run in executor to avoid blocking async loop (run_in_executor needed for sync SDK methods)
-    loop = asyncio.get_running_loop()
-
-    def _synthesize():
-        result = synthesizer.speak_ssml_async(ssml).get()
-        return result
-
-    result = await loop.run_in_executor(None, _synthesize)
-
-    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        pass
-    elif result.reason == speechsdk.ResultReason.Canceled:
-        cancellation_details = result.cancellation_details
-        error_msg = f"Azure Speech canceled: {cancellation_details.reason}"
-        if cancellation_details.reason == speechsdk.CancellationReason.Error:
-            error_msg += f" Error details: {cancellation_details.error_details}"
-        raise Exception(error_msg)
-
-
 async def text_to_voice(
     text: str, gender: str = "m", anonymize: bool = False, retries: int = 3
 ) -> FSInputFile:
@@ -123,139 +62,78 @@ async def text_to_voice(
     else:
         config = VOICES["m"]
 
-    text_len = len(text)
-
     # 1. Setup paths
     base_dir = os.path.dirname(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     )
     temp_dir = os.path.join(base_dir, "temp")
-    cache_dir = os.path.join(base_dir, "cache", "tts")
 
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
 
     # 2. Check Cache
-    unique_string = (
-        f"{text}_{config['voice']}_{config['pitch']}_{config['rate']}_{anonymize}"
+    cache_key = tts_cache.key(
+        text, config["voice"], config["pitch"], config["rate"], anonymize
     )
-    cache_key = hashlib.md5(unique_string.encode("utf-8")).hexdigest()
-    cache_path = os.path.join(cache_dir, f"{cache_key}.mp3")
+    cache_path = tts_cache.get(cache_key)
 
     file_path = os.path.join(temp_dir, f"{uuid.uuid4()}.mp3")
 
-    if os.path.exists(cache_path):
+    if cache_path:
+        # Served in place; cleanup skips cache-owned paths
+        logging.info(f"TTS Cache Hit: {cache_key}")
+        return FSInputFile(cache_path)
+
+    # 3. Join an identical synthesis already in progress
+    task = _in_flight.get(cache_key)
+    if task is not None:
+        logging.info(f"TTS coalesced: {cache_key}")
+        result = await asyncio.shield(task)
+        cache_path = tts_cache.get(cache_key)
+        if cache_path:
+            return FSInputFile(cache_path)
+        # Not cached (disk error): the first caller deletes its file after
+        # sending, so take a copy, or synthesize our own if it is gone already
         try:
-            shutil.copy(cache_path, file_path)
-            logging.info(f"TTS Cache Hit: {cache_key}")
+            shutil.copyfile(result.path, file_path)
             return FSInputFile(file_path)
-        except Exception as e:
-            logging.error(f"Cache copy failed: {e}")
-
-    # 3. Check Azure Eligibility
-    use_azure = False
-    month_key = get_month_key()
-
-    # Only if keys are present
-    if AZURE_SPEECH_KEY and AZURE_SPEECH_REGION:
-        try:
-            current_usage = db.increment_global_config(month_key, 0)
-            if current_usage + text_len < AZURE_MONTHLY_LIMIT:
-                use_azure = True
-            else:
-                logging.info(f"Azure limit reached for {month_key}: {current_usage}")
-        except Exception as e:
-            logging.error(f"DB error checking TTS usage: {e}")
-
-    # 4. Try Azure if eligible
-    if use_azure:
-        try:
-            await generate_azure_speech(text, config, file_path)
-
-            # Apply anonymization if requested (Azure also needs it)
-            if anonymize:
-                await _apply_anonymization(file_path, is_video=False)
+        except OSError as e:
+            logging.info(f"TTS coalesced clip unavailable, synthesizing: {e}")
+            return await _synthesize(
+                text, config, anonymize, cache_key, file_path, retries
+            )
 
-            # If success, increment counter AND cache
-            db.increment_global_config(month_key, text_len)
-            logging.info(f"Azure TTS success. Used: {text_len} chars")
+    task = asyncio.ensure_future(
+        _synthesize(text, config, anonymize, cache_key, file_path, retries)
+    )
+    _in_flight[cache_key] = task
+    task.add_done_callback(lambda _: _in_flight.pop(cache_key, None))
+    # Shielded so a cancelled first caller doesn't fail the others
+    return await asyncio.shield(task)
+
+
+async def _synthesize(
+    text: str,
+    config: dict,
+    anonymize: bool,
+    cache_key: str,
+    file_path: str,
+    retries: int,
+) -> FSInputFile:
+    """Synthesize via the provider router and cache the clip."""
+    # A custom voice or modified pitch/rate may be what fails; the router
+    # then falls back to the safe voice on the same provider
+    provider = await tts_router.synthesize(
+        text, config, file_path, retries, fallback=SAFE_VOICE
+    )
+    logging.info(f"TTS via {provider.name}: {len(text)} chars")
 
-            try:
-                shutil.copy(file_path, cache_path)
-            except Exception as e:
-                logging.error(f"Failed to save to cache: {e}")
+    # Apply anonymization if requested
+    if anonymize:
+        await _apply_anonymization(file_path, is_video=False)
 
-            return FSInputFile(file_path)
-        except Exception as e:
-            logging.error(f"Azure TTS failed, falling back to Edge: {e}")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    pass
-
-    # 5. Fallback to Edge TTS
-    async with semaphore:
-        for attempt in range(retries):
-            try:
-                communicate = edge_tts.Communicate(
-                    text, config["voice"], pitch=config["pitch"], rate=config["rate"]
-                )
-                await communicate.save(file_path)
-
-                # Apply anonymization if requested
-                if anonymize:
-                    await _apply_anonymization(file_path, is_video=False)
-
-                # Save to cache also for Edge
-                try:
-                    shutil.copy(file_path, cache_path)
-                except Exception as e:
-                    logging.error(f"Failed to save to cache (Edge): {e}")
-
-                return FSInputFile(file_path)
-            except Exception as e:
-                if attempt == retries - 1:
-                    # If all retries failed, try falling back to a safe default voice (e.g. Dmytro)
-                    # This handles cases where a user-provided custom voice name is invalid or fails.
-                    safe_voice = "uk-UA-OstapNeural"
-                    # Try fallback if voice is different OR if using modified pitch/rate (which might be the cause)
-                    should_fallback = (
-                        config["voice"] != safe_voice
-                        or config["pitch"] != "+0Hz"
-                        or config["rate"] != "+0%"
-                    )
-
-                    if should_fallback:
-                        logging.warning(
-                            f"Voice {config['voice']} failed after retries. Falling back to safe {safe_voice}. Error: {e}"
-                        )
-                        try:
-                            # Use default pitch/rate for safety
-                            communicate = edge_tts.Communicate(text, safe_voice)
-                            await communicate.save(file_path)
-
-                            # Apply anonymization if requested
-                            if anonymize:
-                                await _apply_anonymization(file_path, is_video=False)
-
-                            # Save to cache also for Edge
-                            try:
-                                shutil.copy(file_path, cache_path)
-                            except Exception as e:
-                                logging.error(f"Failed to save to cache (Edge): {e}")
-
-                            return FSInputFile(file_path)
-                        except Exception as fallback_e:
-                            logging.error(f"Fallback voice also failed: {fallback_e}")
-                            pass  # Will raise original error below
-
-                    raise e
-                await asyncio.sleep(2**attempt)
-
-    raise Exception("Failed to generate voice after retries")
+    tts_cache.put(cache_key, file_path)
+    return FSInputFile(file_path)
 
 
 async def _apply_anonymization(file_path: str, is_video: bool = False):
@@ -364,7 +242,7 @@ async def cleanup_voice(voice_file: Union[FSInputFile, str]):
         return
 
     path = voice_file.path if hasattr(voice_file, "path") else voice_file
-    if not path or not isinstance(path, str):
+    if not path or not isinstance(path, str) or tts_cache.owns(path):
         return
 
     try:
@@ -6,3 +6,4 @@ class Form(StatesGroup):
     confirming_media = State()
     customizing_draw = State()
     setting_cooldown = State()
+    broadcast_message = State()
@@ -0,0 +1,18 @@
+import asyncio
+import logging
+from config import COUNTERS_FLUSH_INTERVAL
+from services.counters import counters
+
+
+async def flush_counters():
+    """
+    Background task that persists usage counters in batches.
+    Runs every COUNTERS_FLUSH_INTERVAL seconds.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(COUNTERS_FLUSH_INTERVAL)
+        try:
+            await loop.run_in_executor(None, counters.flush)
+        except Exception as e:
+            logging.error(f"Error flushing counters: {e}")
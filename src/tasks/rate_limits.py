@@ -0,0 +1,19 @@
+import asyncio
+import logging
+from database import adb
+from config import RATE_LIMIT_SNAPSHOT_INTERVAL
+from services.rate_limiter import rate_limiter
+
+
+async def snapshot_rate_limits():
+    """
+    Background task that persists active pair cooldowns,
+    so a restart doesn't reset them.
+    Runs every RATE_LIMIT_SNAPSHOT_INTERVAL seconds.
+    """
+    while True:
+        await asyncio.sleep(RATE_LIMIT_SNAPSHOT_INTERVAL)
+        try:
+            await adb.save_cooldowns(rate_limiter.snapshot())
+        except Exception as e:
+            logging.error(f"Error saving rate limit snapshot: {e}")
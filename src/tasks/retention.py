@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from database import adb
+from fsm_storage import fsm_ttl
+from config import (
+    RETENTION_INTERVAL,
+    RETENTION_CHUNK,
+    RETENTION_LINK_DAYS,
+    RETENTION_COOLDOWN_DAYS,
+    RETENTION_IDENTITY_DAYS,
+    RETENTION_BLOCK_DAYS,
+    RETENTION_FILE_ID_DAYS,
+)
+
+# (table, timestamp column, days to keep) for rows that are simply deleted
+RETENTION_POLICIES = (
+    ("cooldowns", "last_sent_at", RETENTION_COOLDOWN_DAYS),
+    ("anon_identities", "updated_at", RETENTION_IDENTITY_DAYS),
+    ("user_blocks", "blocked_at", RETENTION_BLOCK_DAYS),
+    ("media_file_ids", "created_at", RETENTION_FILE_ID_DAYS),
+)
+
+
+async def _drain(step) -> int:
+    """Run a chunked step until it reports no more rows.
+    Yields to the event loop between chunks so other writes interleave."""
+    total = 0
+    while True:
+        count = await step()
+        total += count
+        if count < RETENTION_CHUNK:
+            return total
+        await asyncio.sleep(0)
+
+
+async def run_retention() -> dict:
+    """Prune and archive expired rows once. Returns rows handled per table
+    and the bytes returned to SQLite's free list."""
+    report = {}
+    free_before = await adb.get_free_bytes()
+
+    if RETENTION_LINK_DAYS > 0:
+        report["message_links"] = await _drain(
+            lambda: adb.archive_message_links(RETENTION_LINK_DAYS, RETENTION_CHUNK)
+        )
+
+    for table, column, days in RETENTION_POLICIES:
+        if days > 0:
+            report[table] = await _drain(
+                lambda: adb.prune_expired(table, column, days, RETENTION_CHUNK)
+            )
+
+    report["fsm_state"] = await _drain(
+        lambda: adb.prune_fsm_state(fsm_ttl(), RETENTION_CHUNK)
+    )
+
+    report["bytes_reclaimed"] = max(0, await adb.get_free_bytes() - free_before)
+    return report
+
+
+async def retention_worker():
+    """
+    Background task that keeps the hot tables small.
+    Runs every RETENTION_INTERVAL seconds.
+    """
+    while True:
+        try:
+            report = await run_retention()
+            logging.info(f"Retention pass: {report}")
+        except Exception as e:
+            logging.error(f"Error in retention worker: {e}")
+
+        await asyncio.sleep(RETENTION_INTERVAL)
@@ -1,9 +1,8 @@
 import asyncio
 import logging
-import sqlite3
 from aiogram import Bot
 from aiogram.fsm.storage.base import StorageKey
-from database import db
+from database import db, adb
 
 
 async def clean_stale_sessions(bot: Bot, storage):
@@ -13,16 +12,10 @@ async def clean_stale_sessions(bot: Bot, storage):
     """
     while True:
         try:
-            session_minutes = int(db.get_global_config("session_time", "5"))
+            session_minutes = db.config.get("session_time")
 
             if session_minutes > 0:
-                with sqlite3.connect(db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        f"SELECT user_a, user_b FROM active_sessions "
-                        f"WHERE updated_at < datetime('now', '-{session_minutes} minutes')"
-                    )
-                    expired_pairs = cursor.fetchall()
+                expired_pairs = await adb.get_expired_sessions(session_minutes)
 
                 for u1, u2 in expired_pairs:
                     for user_id in [u1, u2]:
@@ -35,7 +28,7 @@ async def clean_stale_sessions(bot: Bot, storage):
                             await storage.set_state(key, None)
                             await storage.set_data(key, {})
 
-                    db.delete_session(u1, u2)
+                    await adb.delete_session(u1, u2)
 
         except Exception as e:
             logging.error(f"Error in session cleaner: {e}")
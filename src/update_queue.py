@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import UPDATE_WORKERS, UPDATE_QUEUE_SIZE
+from middlewares.media_group import MediaGroupMiddleware, media_group
+
+
+class _Item:
+    __slots__ = ("key", "queued_at", "factory", "future")
+
+    def __init__(self, key: Hashable, factory, future):
+        self.key = key
+        self.queued_at = time.monotonic()
+        self.factory = factory
+        self.future = future
+
+
+class UpdateQueue:
+    """Per-key FIFO queues drained by a shared pool of workers.
+
+    Work for one key (a user) runs strictly in order, work for different
+    keys runs in parallel. Keys with pending work wait in a round-robin
+    line and a worker takes one item per turn, so a user with a backlog
+    can't starve the others. A key's queue is dropped as soon as it is
+    empty, so idle users cost nothing.
+
+    A place can be reserved for work that isn't ready yet (an album still
+    being collected). Until it is filled the key is parked: later work of
+    that key waits behind it, but no worker is held.
+    """
+
+    def __init__(
+        self, workers: int = UPDATE_WORKERS, max_pending: int = UPDATE_QUEUE_SIZE
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._queues: Dict[Hashable, deque] = {}
+        # Keys whose next item is an unfilled reservation
+        self._parked = set()
+        self._ready: asyncio.Queue = None
+        self._tasks = []
+        self.pending = 0
+        self.busy = 0
+        # Queue wait time: enqueue -> a worker starts the item
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _ensure_started(self):
+        if not self._tasks:
+            self._ready = asyncio.Queue()
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    def _put(self, key: Hashable, factory, future) -> _Item:
+        self._ensure_started()
+        self.pending += 1
+        item = _Item(key, factory, future)
+        q = self._queues.get(key)
+        if q is None:
+            # A new key: no worker owns it, so it joins the line
+            self._queues[key] = deque([item])
+            self._advance(key)
+        else:
+            q.append(item)
+        return item
+
+    def _advance(self, key: Hashable):
+        """Put a key nobody owns back in line, park it, or drop it if idle."""
+        q = self._queues[key]
+        if not q:
+            del self._queues[key]
+        elif q[0].factory is None:
+            self._parked.add(key)
+        else:
+            self._ready.put_nowait(key)
+
+    def submit(self, key: Hashable, factory: Callable[[], Awaitable]) -> bool:
+        """Queue work without waiting for it. Returns False if the queue is full."""
+        if not self.has_room():
+            return False
+        self._put(key, factory, None)
+        return True
+
+    async def run(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable],
+        slot: Optional[_Item] = None,
+    ) -> Any:
+        """Queue work and wait for its result. With a `slot` from reserve(key)
+        the work takes that place in line."""
+        future = asyncio.get_running_loop().create_future()
+        if slot is None:
+            self._put(key, factory, future)
+        else:
+            slot.future = future
+            self.fill(slot, factory)
+        return await future
+
+    def reserve(self, key: Hashable) -> _Item:
+        """Hold the next place in `key`'s line. It counts as pending, so
+        check has_room() first where the queue must stay bounded."""
+        return self._put(key, None, None)
+
+    def fill(self, slot: _Item, factory: Optional[Callable[[], Awaitable]]):
+        """Hand work to a reserved place; None gives the place up."""
+        q = self._queues[slot.key]
+        if factory is None:
+            q.remove(slot)
+            self.pending -= 1
+        else:
+            slot.factory = factory
+            # Queue wait is counted from here, not from the reservation
+            slot.queued_at = time.monotonic()
+        if slot.key in self._parked and (not q or q[0].factory is not None):
+            self._parked.discard(slot.key)
+            self._advance(slot.key)
+
+    def has_room(self) -> bool:
+        return self.pending < self.max_pending
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            item = self._queues[key].popleft()
+            factory, future = item.factory, item.future
+            self.pending -= 1
+            self.busy += 1
+            wait = time.monotonic() - item.queued_at
+            self.started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                result = await factory()
+            except Exception as e:
+                if future is None:
+                    logging.error(f"Update for {key} failed: {e}")
+                elif not future.done():
+                    future.set_exception(e)
+            else:
+                if future is not None and not future.done():
+                    future.set_result(result)
+            finally:
+                self.busy -= 1
+                self._advance(key)
+
+    async def join(self):
+        """Wait until everything queued so far has been processed."""
+        while self.pending or self.busy:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> dict:
+        return {
+            "pending": self.pending,
+            "busy": self.busy,
+            "keys": len(self._queues),
+            "parked": len(self._parked),
+            "avg_wait_ms": (
+                self.total_wait / self.started * 1000 if self.started else 0.0
+            ),
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+def update_key(update: Update):
+    """Ordering key of an update: its user, else its chat, else nothing."""
+    event = update.event
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat else None
+
+
+class OrderedUpdatesMiddleware(BaseMiddleware):
+    """Outer update middleware that runs each user's updates in order on the
+    shared queue (polling mode; the webhook submits to the queue directly).
+
+    Album parts are collected before queueing, like the webhook does: the
+    first part reserves the user's place in line and the finished album
+    takes it, so later updates of the user run after the album.
+    """
+
+    def __init__(
+        self, queue: "UpdateQueue", albums: MediaGroupMiddleware = media_group
+    ):
+        self.queue = queue
+        self.albums = albums
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        key = update_key(event)
+        if key is None:
+            return await handler(event, data)
+        message = event.message
+        if not (message and message.media_group_id):
+            return await self.queue.run(key, lambda: handler(event, data))
+
+        if self.albums.join(message):
+            return None
+        album = self.albums.open(message)
+        if album is None:
+            # Too many albums being collected: handled as a single message
+            data["album"] = None
+            return await self.queue.run(key, lambda: handler(event, data))
+        slot = self.queue.reserve(key)
+        try:
+            data["album"] = await self.albums.complete(album)
+        except BaseException:
+            self.queue.fill(slot, None)
+            raise
+        return await self.queue.run(key, lambda: handler(event, data), slot)
+
+
+update_queue = UpdateQueue()
@@ -3,7 +3,7 @@ import random
 from typing import Union, Optional
 from aiogram import types, Bot
 from aiogram.types import Message
-from database import db
+from database import adb
 
 
 async def get_lang(
@@ -12,7 +12,7 @@ async def get_lang(
     bot: Optional[Bot] = None,
 ) -> str:
     # 1. Check database for saved setting
-    lang = db.get_user_lang(user_id, None)
+    lang = await adb.get_user_lang(user_id, None)
     if lang:
         return lang
 
@@ -0,0 +1,168 @@
+import asyncio
+import hmac
+import logging
+import secrets
+import time
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+)
+from middlewares.media_group import MediaGroupMiddleware, media_group
+from update_queue import UpdateQueue, update_queue, update_key
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates over HTTP and processes them on the update queue.
+
+    A request is acknowledged as soon as its update is queued, so Telegram
+    never waits for a handler. Updates of one user are processed in order.
+    The queue is bounded: when it is full the request gets 503 and Telegram
+    redelivers the update later. Requests without the secret token get 401;
+    a secret is required.
+
+    Album parts are collected here, before the queue: the first part
+    reserves the user's place in line, and the finished album takes it as
+    one update. The collection wait holds no worker, and the user's later
+    updates run after the album.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        queue: UpdateQueue = update_queue,
+        albums: MediaGroupMiddleware = media_group,
+    ):
+        if not secret:
+            raise ValueError("WebhookServer needs a secret token")
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.queue = queue
+        self.albums = albums
+        self._collecting = set()
+        self.workflow_data = {}
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.total_handle_time = 0.0
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/metrics", self.handle_metrics)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(
+                await request.json(), context={"bot": self.bot}
+            )
+        except ValueError:
+            return web.Response(status=400)
+        key = update_key(update)
+        if key is None:
+            key = ("update", update.update_id)
+        message = update.message
+        is_album_part = bool(message and message.media_group_id)
+        if is_album_part and self.albums.join(message):
+            self.received += 1
+            return web.Response()
+        if not self.queue.has_room():
+            self.rejected += 1
+            return web.Response(status=503)
+
+        album = self.albums.open(message) if is_album_part else None
+        if album is not None:
+            task = asyncio.create_task(
+                self._queue_album(self.queue.reserve(key), update, album)
+            )
+            self._collecting.add(task)
+            task.add_done_callback(self._collecting.discard)
+        else:
+            # Parts of albums over the collection limits go out one by one
+            extra = {"album": None} if is_album_part else {}
+            self.queue.submit(key, lambda: self._process(update, **extra))
+        self.received += 1
+        return web.Response()
+
+    async def _queue_album(self, slot, update: Update, album):
+        try:
+            messages = await self.albums.complete(album)
+        except BaseException:
+            self.queue.fill(slot, None)
+            raise
+        self.queue.fill(slot, lambda: self._process(update, album=messages))
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics())
+
+    async def _process(self, update: Update, **kwargs):
+        started = time.monotonic()
+        try:
+            await self.dp.feed_update(self.bot, update, **self.workflow_data, **kwargs)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Webhook update failed: {e}")
+        finally:
+            self.total_handle_time += time.monotonic() - started
+
+    def metrics(self) -> dict:
+        done = self.processed + self.failed
+        queue = self.queue.metrics()
+        return {
+            "queued": queue["pending"],
+            "in_flight": queue["busy"],
+            "avg_wait_ms": queue["avg_wait_ms"],
+            "max_wait_ms": queue["max_wait_ms"],
+            "received": self.received,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_handle_ms": self.total_handle_time / done * 1000 if done else 0.0,
+        }
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Serve updates via webhook until cancelled (replaces dp.start_polling).
+    Without WEBHOOK_SECRET a random secret is registered for this run."""
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    server = WebhookServer(dp, bot, secret=secret)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    await dp.emit_startup(bot=bot, **workflow_data)
+    server.workflow_data = workflow_data
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"Webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # Stop taking requests first, then drain what was already accepted
+        await runner.cleanup()
+        await server.queue.stop()
+        try:
+            await dp.emit_shutdown(bot=bot, **workflow_data)
+        finally:
+            await bot.session.close()
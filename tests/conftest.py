@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"
+)
+sys.path.insert(0, SRC_DIR)
+
+# The database and TTS cache singletons are created on import; keep them
+# out of data/ and cache/
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DB_PATH", os.path.join(_tmp, "anon_bot.db"))
+os.environ.setdefault("TTS_CACHE_DIR", os.path.join(_tmp, "tts"))
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+TOKEN = "123456:TEST-token"
+
+
+class FakeBotAPI:
+    """Local stand-in for the Bot API that records every call.
+
+    `flood[chat_id]` makes the next request to that chat fail with 429 and
+    that retry_after; `delay` slows every response down (seconds).
+    `media[message_id]` is the file_id sent as each media group item.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.media = {}
+        self.flood = {}
+        self.delay = 0.0
+        self._next_id = 0
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        chat_id = int(data.get("chat_id", 0))
+        self.calls.append((time.monotonic(), method, data))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        retry_after = self.flood.pop(chat_id, None)
+        if retry_after is not None:
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }
+            )
+        if method in ("setMessageReaction", "setWebhook"):
+            return web.json_response({"ok": True, "result": True})
+        if method == "sendMediaGroup":
+            result = []
+            for item in json.loads(data["media"]):
+                result.append(self._message(chat_id))
+                self.media[self._next_id] = item["media"]
+            return web.json_response({"ok": True, "result": result})
+        return web.json_response(
+            {"ok": True, "result": self._message(chat_id, data.get("text", ""))}
+        )
+
+    def _message(self, chat_id: int, text: str = "") -> dict:
+        self._next_id += 1
+        return {
+            "message_id": self._next_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    def methods(self, name: str = None):
+        return [m for _, m, _ in self.calls if name is None or m == name]
+
+
+@asynccontextmanager
+async def fake_bot():
+    """Yield (bot, api) with the bot talking to a local FakeBotAPI."""
+    api = FakeBotAPI()
+    server = TestServer(api.app)
+    await server.start_server()
+    session = AiohttpSession(
+        api=TelegramAPIServer.from_base(str(server.make_url("")).rstrip("/"))
+    )
+    bot = Bot(TOKEN, session=session)
+    try:
+        yield bot, api
+    finally:
+        await bot.session.close()
+        await server.close()
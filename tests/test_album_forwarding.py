@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, PhotoSize, User
+
+from database import AsyncDatabase, Database
+from logic import forwarding
+from services.send_scheduler import SendScheduler
+
+from fake_bot_api import fake_bot
+
+SENDER_ID = 10
+TARGET_ID = 20
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = Database(str(tmp_path / "bot.db"))
+    adb = AsyncDatabase(database)
+    monkeypatch.setattr(forwarding, "adb", adb)
+    monkeypatch.setattr(
+        forwarding, "send_scheduler", SendScheduler(per_chat_rate=0, global_rate=0)
+    )
+    yield database
+    adb.close()
+    database.close()
+
+
+def _photo(bot, message_id: int) -> Message:
+    return Message(
+        message_id=message_id,
+        date=int(time.time()),
+        chat=Chat(id=SENDER_ID, type="private"),
+        from_user=User(id=SENDER_ID, is_bot=False, first_name="Sender"),
+        media_group_id="album",
+        photo=[
+            PhotoSize(
+                file_id=f"photo-{message_id}",
+                file_unique_id=f"u{message_id}",
+                width=1,
+                height=1,
+            )
+        ],
+    ).as_(bot)
+
+
+def _forward_album(items: int, in_dialogue: bool):
+    async def main():
+        async with fake_bot() as (bot, api):
+            storage = MemoryStorage()
+            if in_dialogue:
+                await storage.set_data(
+                    StorageKey(bot.id, TARGET_ID, TARGET_ID), {"target_id": SENDER_ID}
+                )
+            state = FSMContext(storage, StorageKey(bot.id, SENDER_ID, SENDER_ID))
+            album = [_photo(bot, 100 + i) for i in range(items)]
+            await forwarding.handle_forwarding(
+                bot, album[0], TARGET_ID, SENDER_ID, state, album=album, check_cd=False
+            )
+            return api
+
+    return asyncio.run(main())
+
+
+def _links(database):
+    with database._read_connection() as conn:
+        return conn.execute(
+            "SELECT receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, sender_chat_id FROM message_links ORDER BY receiver_msg_id"
+        ).fetchall()
+
+
+def test_every_album_item_is_linked_to_its_source(database):
+    api = _forward_album(10, in_dialogue=True)
+
+    links = _links(database)
+    assert len(api.media) == 10
+    assert len(links) == 10
+    for receiver_msg_id, receiver_chat_id, sender_id, sender_msg_id, chat_id in links:
+        assert (receiver_chat_id, sender_id, chat_id) == (
+            TARGET_ID,
+            SENDER_ID,
+            SENDER_ID,
+        )
+        assert api.media[receiver_msg_id] == f"photo-{sender_msg_id}"
+
+
+def test_action_button_is_linked_to_the_first_item(database):
+    api = _forward_album(10, in_dialogue=False)
+
+    links = _links(database)
+    assert len(links) == 11
+    button = [link for link in links if link[0] not in api.media]
+    assert [link[3] for link in button] == [100]
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from database import Database
+
+RECEIVER_ID = 1
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "bot.db")
+
+
+def _numbers(database):
+    with database._read_connection() as conn:
+        return [
+            row[0]
+            for row in conn.execute(
+                "SELECT anon_num FROM anon_identities WHERE receiver_id = ?",
+                (RECEIVER_ID,),
+            )
+        ]
+
+
+def test_concurrent_first_messages_get_distinct_numbers(path):
+    # Two instances on one file, like two bot processes
+    first, second = Database(path), Database(path)
+
+    def first_message(sender_id):
+        database = first if sender_id % 2 else second
+        return database.get_or_create_anon_num(RECEIVER_ID, sender_id)
+
+    with ThreadPoolExecutor(16) as pool:
+        issued = list(pool.map(first_message, range(100, 1100)))
+
+    assert len(set(issued)) == len(issued)
+    assert sorted(_numbers(first)) == sorted(issued)
+    first.close()
+    second.close()
+
+
+def test_concurrent_first_messages_of_one_sender_share_a_number(path):
+    database = Database(path)
+    with ThreadPoolExecutor(8) as pool:
+        issued = set(
+            pool.map(
+                lambda _: database.get_or_create_anon_num(RECEIVER_ID, 2), range(8)
+            )
+        )
+
+    assert len(issued) == 1
+    assert _numbers(database) == list(issued)
+    database.close()
+
+
+def test_full_range_moves_to_the_next(path):
+    database = Database(path)
+    with database._get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO anon_identities (sender_id, receiver_id, anon_num) VALUES (?, ?, ?)",
+            [(1000 + n, RECEIVER_ID, f"№{n:03d}") for n in range(1, 1000)],
+        )
+        conn.commit()
+
+    number = database.get_or_create_anon_num(RECEIVER_ID, 2)
+
+    assert 1000 <= int(number[1:]) <= 9999
+    assert len(set(_numbers(database))) == 1000
+    database.close()
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from database import AsyncDatabase, Database
+from services import broadcast
+from services.broadcast import Broadcaster
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "bot.db"))
+    yield database
+    database.close()
+
+
+def _statuses(database):
+    with database._read_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT status FROM broadcasts")]
+
+
+def test_only_one_broadcast_runs_at_a_time(database):
+    # A second process on the same file
+    other = Database(database.db_path)
+
+    assert database.create_broadcast(1, 10) is not None
+    assert other.create_broadcast(1, 11) is None
+    assert _statuses(database) == ["running"]
+    other.close()
+
+
+def test_a_finished_broadcast_allows_the_next(database):
+    first = database.create_broadcast(1, 10)
+    database.finish_broadcast(first)
+
+    assert database.create_broadcast(1, 11) is not None
+    assert sorted(_statuses(database)) == ["done", "running"]
+
+
+def test_simultaneous_starts_create_one_broadcast(database, monkeypatch):
+    adb = AsyncDatabase(database)
+    monkeypatch.setattr(broadcast, "adb", adb)
+    broadcaster = Broadcaster()
+
+    async def main():
+        # No recipients, so the bot is never used
+        started = await asyncio.gather(
+            broadcaster.start(None, 1, 10), broadcaster.start(None, 1, 11)
+        )
+        await broadcaster._task
+        return started
+
+    assert sorted(asyncio.run(main())) == [False, True]
+    assert _statuses(database) == ["done"]
+    adb.close()
@@ -0,0 +1,53 @@
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "bot.db"))
+    database.update_user_settings(1, lang="en", receive_messages=0, auto_voice=1)
+    database.update_user_settings(2, lang="uk")
+    database.update_user_settings(3, receive_media=0)
+    database.block_user(1, 2)
+    database.get_or_create_anon_num(1, 3)
+    database.get_or_create_anon_num(3, 2)
+    yield database
+    database.close()
+
+
+def _separate_calls(database, target_id, sender_id):
+    """The lookups handle_forwarding made before get_delivery_context."""
+    with database._read_connection() as conn:
+        anon_num = conn.execute(
+            "SELECT anon_num FROM anon_identities WHERE sender_id = ? AND receiver_id = ?",
+            (sender_id, target_id),
+        ).fetchone()
+    return (
+        database.get_user_settings(target_id).as_dict(),
+        database.get_user_lang(target_id, None) or "uk",
+        database.get_user_lang(sender_id, None) or "uk",
+        database.is_blocked(target_id, sender_id),
+        anon_num[0] if anon_num else None,
+    )
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["cold", "warm"])
+@pytest.mark.parametrize(
+    "target_id, sender_id",
+    [(1, 2), (2, 1), (1, 3), (3, 2), (2, 3), (4, 5), (5, 1)],
+)
+def test_context_matches_separate_lookups(database, target_id, sender_id, cached):
+    expected = _separate_calls(database, target_id, sender_id)
+    if not cached:
+        database.settings_cache.clear()
+
+    ctx = database.get_delivery_context(target_id, sender_id)
+
+    assert (
+        ctx.target_settings.as_dict(),
+        ctx.target_lang,
+        ctx.sender_lang,
+        ctx.is_blocked,
+        ctx.anon_num,
+    ) == expected
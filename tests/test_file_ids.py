@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendVoice
+from aiogram.types import FSInputFile
+
+from database import db
+from services import file_ids
+from services.file_ids import content_key, send_cached
+
+
+class FakeSend:
+    """send(media) callback recording uploads and file_id sends."""
+
+    def __init__(self, reject=None, prefix="id"):
+        self.prefix = prefix
+        self.uploads = 0
+        self.by_id = []
+        self.reject = reject  # error message for file_id sends
+
+    async def __call__(self, media):
+        if isinstance(media, FSInputFile):
+            self.uploads += 1
+            return SimpleNamespace(
+                voice=SimpleNamespace(file_id=f"{self.prefix}{self.uploads}")
+            )
+        self.by_id.append(media)
+        if self.reject:
+            raise TelegramBadRequest(
+                method=SendVoice(chat_id=1, voice=media), message=self.reject
+            )
+        return SimpleNamespace(voice=SimpleNamespace(file_id=media))
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(b"\xff\xfb" + bytes(range(256)) * 8)
+    yield str(path)
+    db.delete_media_file_id(content_key(str(path)), "voice")
+
+
+def test_second_send_reuses_the_file_id(clip):
+    send = FakeSend()
+    asyncio.run(send_cached(clip, "voice", send))
+    asyncio.run(send_cached(clip, "voice", send))
+
+    assert send.uploads == 1
+    assert send.by_id == ["id1"]
+
+
+def test_file_is_hashed_off_the_event_loop(clip, monkeypatch):
+    threads = []
+
+    def recording_content_key(path):
+        threads.append(threading.current_thread())
+        return content_key(path)
+
+    monkeypatch.setattr(file_ids, "content_key", recording_content_key)
+    asyncio.run(send_cached(clip, "voice", FakeSend()))
+
+    assert threads and threading.main_thread() not in threads
+
+
+def test_stale_file_id_is_replaced(clip):
+    asyncio.run(send_cached(clip, "voice", FakeSend()))
+
+    stale = FakeSend(
+        reject="Bad Request: wrong file identifier/HTTP URL specified", prefix="new"
+    )
+    asyncio.run(send_cached(clip, "voice", stale))
+
+    assert stale.by_id == ["id1"]
+    assert stale.uploads == 1
+    assert db.get_media_file_id(content_key(clip), "voice") == "new1"
+
+
+def test_unrelated_error_keeps_the_mapping(clip):
+    asyncio.run(send_cached(clip, "voice", FakeSend()))
+
+    failing = FakeSend(reject="Bad Request: message to be replied not found")
+    with pytest.raises(TelegramBadRequest):
+        asyncio.run(send_cached(clip, "voice", failing))
+
+    assert failing.uploads == 0
+    assert db.get_media_file_id(content_key(clip), "voice") == "id1"
+
+
+def test_retention_prunes_old_file_ids(clip):
+    key = content_key(clip)
+    db.save_media_file_id(key, "voice", "old")
+    with db._get_connection() as conn:
+        conn.execute(
+            "UPDATE media_file_ids SET created_at = datetime('now', '-30 days') WHERE content_key = ?",
+            (key,),
+        )
+        conn.commit()
+
+    assert db.prune_expired("media_file_ids", "created_at", 7, 500) == 1
+    assert db.get_media_file_id(key, "voice") is None
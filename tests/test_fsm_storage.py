@@ -0,0 +1,76 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+import fsm_storage
+from database import db
+from fsm_storage import SQLiteStorage, fsm_ttl
+from states import Form
+
+
+def test_state_survives_restart_and_keeps_its_preview():
+    key = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+    async def write():
+        storage = SQLiteStorage()
+        await storage.set_state(key, Form.confirming_media)
+        await storage.set_data(key, {"media_path": "/tmp/preview.mp3"})
+        await storage.close()
+
+    async def read():
+        storage = SQLiteStorage()
+        return await storage.get_state(key), await storage.get_data(key)
+
+    asyncio.run(write())
+    state, data = asyncio.run(read())
+
+    assert state == Form.confirming_media.state
+    assert data == {"media_path": "/tmp/preview.mp3"}
+    # startup_cleanup keeps files referenced by live records
+    assert "/tmp/preview.mp3" in db.get_fsm_file_paths(fsm_ttl())
+    assert "/tmp/preview.mp3" not in db.get_fsm_file_paths(-3600)
+
+
+class _SlowSave:
+    """adb whose FSM writes wait until `release` is set."""
+
+    def __init__(self, adb):
+        self.adb = adb
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.adb, name)
+
+    async def save_fsm_records(self, rows):
+        await self.release.wait()
+        await self.adb.save_fsm_records(rows)
+
+
+def test_evicted_record_is_readable_while_its_write_is_in_flight(monkeypatch):
+    key = StorageKey(bot_id=1, chat_id=43, user_id=43)
+    other = StorageKey(bot_id=1, chat_id=44, user_id=44)
+
+    async def main():
+        storage = SQLiteStorage(maxsize=1)
+        await storage.set_data(key, {"step": 1})
+        await storage.flush()
+
+        slow = _SlowSave(fsm_storage.adb)
+        monkeypatch.setattr(fsm_storage, "adb", slow)
+        await storage.set_data(key, {"step": 2})
+        # Evicts `key` from the hot set; only the pending batch holds step 2
+        await storage.get_data(other)
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0)
+
+        during = await storage.get_data(key)
+        slow.release.set()
+        await flush
+        after = await SQLiteStorage().get_data(key)
+        await storage.close()
+        return during, after
+
+    during, after = asyncio.run(main())
+
+    assert during == {"step": 2}
+    assert after == {"step": 2}
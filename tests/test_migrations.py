@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from database import Database
+
+# Schema as created by _init_db before versioned migrations existed
+BASELINE_SCHEMA = """
+CREATE TABLE message_links (
+    receiver_msg_id INTEGER,
+    receiver_chat_id INTEGER,
+    sender_id INTEGER,
+    sender_msg_id INTEGER,
+    sender_chat_id INTEGER,
+    anon_num TEXT,
+    poll_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (receiver_msg_id, receiver_chat_id)
+);
+CREATE TABLE user_blocks (
+    user_id INTEGER,
+    blocked_sender_id INTEGER,
+    blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reason_msg_id INTEGER,
+    PRIMARY KEY (user_id, blocked_sender_id)
+);
+CREATE TABLE user_settings (
+    user_id INTEGER PRIMARY KEY,
+    lang TEXT DEFAULT 'uk',
+    receive_media INTEGER DEFAULT 1,
+    receive_messages INTEGER DEFAULT 1,
+    auto_voice INTEGER DEFAULT 0,
+    voice_gender TEXT DEFAULT 'm',
+    skip_confirm_voice INTEGER DEFAULT 0,
+    skip_confirm_media INTEGER DEFAULT 0,
+    anon_audio INTEGER DEFAULT 1
+);
+CREATE TABLE active_sessions (
+    user_a INTEGER,
+    user_b INTEGER,
+    anon_num TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_a, user_b)
+);
+CREATE TABLE anon_identities (
+    sender_id INTEGER,
+    receiver_id INTEGER,
+    anon_num TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sender_id, receiver_id)
+);
+CREATE TABLE global_config (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE cooldowns (
+    sender_id INTEGER,
+    receiver_id INTEGER,
+    last_sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sender_id, receiver_id)
+);
+INSERT INTO message_links (receiver_msg_id, receiver_chat_id, sender_id, poll_id)
+VALUES (1, 10, 20, 'poll');
+INSERT INTO user_settings (user_id, lang) VALUES (20, 'en');
+"""
+
+# Hot queries, as issued by the Database methods
+HOT_QUERIES = {
+    "get_link_by_poll": (
+        "SELECT sender_id, receiver_msg_id, receiver_chat_id FROM message_links WHERE poll_id = ?",
+        ("poll",),
+    ),
+    "is_sender_anon": (
+        "SELECT 1 FROM message_links WHERE sender_id = ? AND receiver_chat_id = ?",
+        (20, 10),
+    ),
+    "get_last_msg_timestamp": (
+        "SELECT strftime('%s', created_at) FROM message_links WHERE sender_id = ? AND receiver_chat_id = ? ORDER BY created_at DESC LIMIT 1",
+        (20, 10),
+    ),
+    "anon_num_probe": (
+        "SELECT 1 FROM anon_identities WHERE receiver_id = ? AND anon_num = ? AND updated_at > datetime('now', ?) LIMIT 1",
+        (10, "№001", "-30 days"),
+    ),
+    "get_expired_sessions": (
+        "SELECT user_a, user_b FROM active_sessions WHERE updated_at < datetime('now', ?)",
+        ("-30 minutes",),
+    ),
+}
+
+
+@pytest.fixture
+def upgraded(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    database = Database(path, write_behind_ms=0)
+    yield database
+    database.close()
+
+
+def test_upgrade_sets_version_and_keeps_rows(upgraded):
+    with upgraded._read_connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    assert version == len(Database.MIGRATIONS)
+    assert upgraded.get_link_by_poll("poll") == (20, 1, 10)
+    assert upgraded.get_user_lang(20) == "en"
+
+
+def test_reopening_runs_no_migrations(upgraded, monkeypatch):
+    def fail(*args):
+        raise AssertionError("migration re-run")
+
+    for name in Database.MIGRATIONS:
+        monkeypatch.setattr(Database, name, fail)
+    Database(upgraded.db_path, write_behind_ms=0).close()
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(upgraded, name):
+    sql, params = HOT_QUERIES[name]
+    with upgraded._read_connection() as conn:
+        plan = " | ".join(
+            row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        )
+    assert "USING" in plan and "INDEX" in plan, plan
+    assert not plan.startswith("SCAN"), plan
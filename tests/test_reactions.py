@@ -0,0 +1,66 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from aiogram.types import Chat, MessageReactionUpdated, ReactionTypeEmoji, User
+
+import handlers.reactions as reactions
+from database import db
+
+from fake_bot_api import fake_bot
+
+RECEIVER = 501
+SENDER = 502
+
+
+@pytest.fixture(autouse=True)
+def short_window(monkeypatch):
+    monkeypatch.setattr(reactions, "REACTION_DEBOUNCE_MS", 50)
+    # Message 10 in the receiver's chat was delivered from message 20 of the sender
+    db.save_message_link(10, RECEIVER, SENDER, 20, SENDER)
+
+
+def _change(old, new):
+    return MessageReactionUpdated(
+        chat=Chat(id=RECEIVER, type="private"),
+        message_id=10,
+        user=User(id=RECEIVER, is_bot=False, first_name="R"),
+        date=datetime.now(),
+        old_reaction=[ReactionTypeEmoji(emoji=e) for e in old],
+        new_reaction=[ReactionTypeEmoji(emoji=e) for e in new],
+    )
+
+
+async def _react(changes):
+    async with fake_bot() as (bot, api):
+        for old, new in changes:
+            await reactions.on_reaction(_change(old, new), bot)
+            await asyncio.sleep(0.01)
+        while reactions._bursts:
+            await asyncio.sleep(0.02)
+        # Let the delivery finish its requests
+        await asyncio.sleep(0.2)
+        return api
+
+
+def test_burst_of_changes_is_delivered_once():
+    changes = [
+        ([], ["👍"]),
+        (["👍"], ["❤"]),
+        (["❤"], ["🔥"]),
+        (["🔥"], ["👎"]),
+        (["👎"], ["🎉"]),
+    ]
+    api = asyncio.run(_react(changes))
+
+    assert api.methods() == ["sendMessage", "setMessageReaction"]
+    notification, sync = (data for _, _, data in api.calls)
+    assert "🎉" in notification["text"]
+    assert json.loads(sync["reaction"]) == [{"type": "emoji", "emoji": "🎉"}]
+
+
+def test_add_then_remove_sends_nothing():
+    api = asyncio.run(_react([([], ["👍"]), (["👍"], [])]))
+
+    assert api.methods() == []
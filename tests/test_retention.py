@@ -0,0 +1,79 @@
+import pytest
+
+from database import Database
+
+
+@pytest.fixture(params=[0, 50], ids=["direct", "write_behind"])
+def database(tmp_path, request):
+    database = Database(str(tmp_path / "bot.db"), write_behind_ms=request.param)
+    yield database
+    database.close()
+
+
+def _age_identities(database, days):
+    with database._get_connection() as conn:
+        conn.execute(
+            "UPDATE anon_identities SET updated_at = datetime('now', ?)",
+            (f"-{days} days",),
+        )
+        conn.commit()
+
+
+def test_active_dialogue_keeps_its_identities(database):
+    first = database.get_or_create_anon_num(2, 1)
+    reply = database.get_or_create_anon_num(1, 2)
+    _age_identities(database, 100)
+
+    database.update_session(1, 2)
+    database.flush_pending()
+
+    assert database.prune_expired("anon_identities", "updated_at", 90, 500) == 0
+    assert database.get_or_create_anon_num(2, 1) == first
+    assert database.get_or_create_anon_num(1, 2) == reply
+
+
+def test_idle_identities_expire(database):
+    database.get_or_create_anon_num(2, 1)
+    database.get_or_create_anon_num(4, 3)
+    _age_identities(database, 100)
+
+    database.update_session(3, 4)
+    database.flush_pending()
+
+    assert database.prune_expired("anon_identities", "updated_at", 90, 500) == 1
+
+
+def _old_dialogue(database):
+    """Links 1 -> 2 and a reply 2 -> 1, all older than the reply window."""
+    for msg_id, (sender, receiver, days) in enumerate(
+        [(1, 2, 40), (1, 2, 38), (2, 1, 37), (1, 2, 35)]
+    ):
+        database.save_message_link(msg_id, receiver, sender, msg_id, sender)
+        database.flush_pending()
+        with database._get_connection() as conn:
+            conn.execute(
+                "UPDATE message_links SET created_at = datetime('now', ?) WHERE receiver_msg_id = ?",
+                (f"-{days} days", msg_id),
+            )
+            conn.commit()
+
+
+def test_archiving_keeps_who_started_the_dialogue(database):
+    _old_dialogue(database)
+    before = database.is_sender_anon(1, 2), database.is_sender_anon(2, 1)
+
+    assert database.archive_message_links(30, 500) == 2
+
+    assert (database.is_sender_anon(1, 2), database.is_sender_anon(2, 1)) == before
+    assert before[0] is False
+
+
+def test_archiving_keeps_the_last_message_time(database):
+    _old_dialogue(database)
+    last_sent = database.get_last_msg_timestamp(1, 2)
+    last_reply = database.get_last_msg_timestamp(2, 1)
+
+    assert database.archive_message_links(30, 500) == 2
+
+    assert database.get_last_msg_timestamp(1, 2) == last_sent
+    assert database.get_last_msg_timestamp(2, 1) == last_reply
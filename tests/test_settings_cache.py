@@ -0,0 +1,44 @@
+from cache import LRUCache
+
+
+def test_invalidation_drops_only_loads_of_that_key():
+    cache = LRUCache()
+    generation = cache.generation
+
+    cache.invalidate("a")
+    cache.set("a", "stale", generation)
+    cache.set("b", "fresh", generation)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "fresh"
+
+
+def test_load_started_after_invalidation_is_stored():
+    cache = LRUCache()
+    cache.invalidate("a")
+    cache.set("a", "fresh", cache.generation)
+
+    assert cache.get("a") == "fresh"
+
+
+def test_forgotten_invalidations_still_drop_older_loads():
+    cache = LRUCache(maxsize=2)
+    generation = cache.generation
+
+    for key in ("a", "b", "c"):
+        cache.invalidate(key)
+    cache.set("a", "stale", generation)
+    cache.set("d", "loaded later", cache.generation)
+
+    assert cache.get("a") is None
+    assert cache.get("d") == "loaded later"
+
+
+def test_clear_drops_loads_in_flight():
+    cache = LRUCache()
+    generation = cache.generation
+
+    cache.clear()
+    cache.set("a", "stale", generation)
+
+    assert cache.get("a") is None
@@ -0,0 +1,29 @@
+import json
+import os
+
+from services.tts_cache import TTSCache
+
+
+def _index(cache):
+    with open(cache.index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_hits_do_not_write_the_index(tmp_path):
+    clip = tmp_path / "clip.mp3"
+    clip.write_bytes(b"mp3")
+    cache = TTSCache(str(tmp_path / "cache"))
+    cache.put("k", str(clip))
+    cache.save()
+    saved = os.stat(cache.index_path).st_mtime_ns
+    # Long past the save interval
+    cache._saved_at = 0
+
+    for _ in range(3):
+        assert cache.get("k") == cache.path("k")
+
+    assert os.stat(cache.index_path).st_mtime_ns == saved
+    assert _index(cache)["k"][2] == 0
+
+    cache.save()
+    assert _index(cache)["k"][2] == 3
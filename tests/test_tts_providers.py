@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from services.tts_providers import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    Health,
+    ProviderUnavailable,
+    StubProvider,
+    TTSRouter,
+)
+from services.voice_engine import SAFE_VOICE
+
+FAKE_VOICE = {"voice": "xx-XX-FakeNeural", "pitch": "+0Hz", "rate": "+0%"}
+GOOD_VOICE = {"voice": "uk-UA-PolinaNeural", "pitch": "+0Hz", "rate": "+0%"}
+
+
+class PickyStub(StubProvider):
+    """Stub that rejects unknown voices, like Edge does."""
+
+    def __init__(self, name: str = "edge", **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.health = Health(failures=3, cooldown=60)
+        self.voices = []
+
+    async def synthesize(self, text, voice_config, path):
+        self.voices.append(voice_config["voice"])
+        if voice_config["voice"].startswith("xx-"):
+            raise ValueError(f"No audio received for {voice_config['voice']}")
+        await super().synthesize(text, voice_config, path)
+
+
+def test_invalid_voice_does_not_open_the_breaker(tmp_path):
+    edge = PickyStub()
+    router = TTSRouter([edge])
+    path = str(tmp_path / "out.mp3")
+
+    async def main():
+        for _ in range(5):
+            assert await router.synthesize("hi", FAKE_VOICE, path, fallback=SAFE_VOICE)
+        return await router.synthesize("hi", GOOD_VOICE, path, fallback=SAFE_VOICE)
+
+    assert asyncio.run(main()) is edge
+    assert edge.health.state == CLOSED
+    assert edge.health.error_rate == 0
+    assert edge.voices[:2] == [FAKE_VOICE["voice"], SAFE_VOICE["voice"]]
+
+
+def test_broken_provider_still_opens_the_breaker(tmp_path):
+    edge = PickyStub(fail=True)
+    router = TTSRouter([edge])
+    path = str(tmp_path / "out.mp3")
+
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(router.synthesize("hi", FAKE_VOICE, path, fallback=SAFE_VOICE))
+    assert edge.health.state == OPEN
+    assert not router.candidates(2)
+
+
+def test_failing_provider_is_skipped_for_the_next(tmp_path):
+    broken, healthy = PickyStub("azure", fail=True), PickyStub("edge")
+    router = TTSRouter([broken, healthy])
+    path = str(tmp_path / "out.mp3")
+
+    provider = asyncio.run(router.synthesize("hi", GOOD_VOICE, path))
+
+    assert provider is healthy
+    assert broken.health.error_rate == 1.0
+
+
+class LateWriter(StubProvider):
+    """Like Azure's SDK: the write happens in a thread that a timeout
+    doesn't stop."""
+
+    name = "azure"
+
+    async def synthesize(self, text, voice_config, path):
+        def write_late():
+            time.sleep(0.3)
+            with open(path, "wb") as f:
+                f.write(b"late")
+
+        await asyncio.get_running_loop().run_in_executor(None, write_late)
+
+
+def test_timed_out_call_cannot_overwrite_the_result(tmp_path):
+    late, edge = LateWriter(), PickyStub("edge")
+    router = TTSRouter([late, edge], timeout=0.05)
+    path = tmp_path / "out.mp3"
+
+    async def main():
+        provider = await router.synthesize("hi", GOOD_VOICE, str(path))
+        # Let the abandoned thread finish its write
+        await asyncio.sleep(0.5)
+        return provider
+
+    assert asyncio.run(main()) is edge
+    assert path.read_bytes() != b"late"
+    assert path.read_bytes().startswith(b"\xff\xfb")
+
+
+def test_cancelled_probe_frees_the_half_open_slot(tmp_path):
+    edge = PickyStub(delay=1)
+    edge.health.state, edge.health.opened_at = OPEN, time.monotonic() - 61
+    router = TTSRouter([edge])
+
+    async def main():
+        probe = asyncio.create_task(
+            router.synthesize("hi", GOOD_VOICE, str(tmp_path / "out.mp3"))
+        )
+        await asyncio.sleep(0.05)
+        # A second call has to wait for the probe
+        assert edge.health.probing and not router.candidates(2)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(main())
+
+    assert edge.health.state == HALF_OPEN
+    assert router.candidates(2) == [edge]
@@ -0,0 +1,86 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message, Update
+
+from middlewares.media_group import MediaGroupMiddleware
+from update_queue import OrderedUpdatesMiddleware, UpdateQueue
+
+from fake_bot_api import TOKEN
+from test_webhook import _album_part, _update
+
+
+def _polling_dispatcher(queue: UpdateQueue, seen: list) -> Dispatcher:
+    """Dispatcher wired like main.py in polling mode."""
+    albums = MediaGroupMiddleware(latency=0.1)
+    dp = Dispatcher()
+    dp.message.middleware(albums)
+    dp.update.outer_middleware(OrderedUpdatesMiddleware(queue, albums))
+
+    @dp.message()
+    async def on_message(message: Message, album: list = None):
+        seen.append(f"album of {len(album)}" if album else message.text)
+
+    return dp
+
+
+def _poll(updates, workers: int = 4):
+    """Feed updates as polling does: each one in its own task, in order."""
+
+    async def main():
+        queue = UpdateQueue(workers=workers)
+        seen = []
+        dp = _polling_dispatcher(queue, seen)
+        bot = Bot(TOKEN)
+        tasks = []
+        for update in updates:
+            update = Update.model_validate(update, context={"bot": bot})
+            tasks.append(asyncio.create_task(dp.feed_update(bot, update)))
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        await queue.stop()
+        await bot.session.close()
+        return seen, queue
+
+    return asyncio.run(main())
+
+
+def test_text_after_an_album_waits_for_it():
+    seen, _ = _poll([_album_part(1, "a"), _album_part(2, "a"), _update(3)])
+
+    assert seen == ["album of 2", "hello"]
+
+
+def test_other_users_are_not_held_up_by_an_album():
+    seen, _ = _poll(
+        [_album_part(1, "a", user_id=1), _album_part(2, "a", user_id=1), _update(3)],
+        workers=1,
+    )
+
+    assert seen == ["hello", "album of 2"]
+
+
+def test_reserved_place_keeps_order_and_can_be_given_up():
+    async def main():
+        queue = UpdateQueue(workers=2)
+        done = []
+
+        async def work(name):
+            done.append(name)
+
+        first = queue.reserve(1)
+        second = queue.reserve(1)
+        queue.submit(1, lambda: work("after"))
+        await asyncio.sleep(0.05)
+        assert done == [] and queue.metrics()["parked"] == 1
+
+        queue.fill(second, lambda: work("second"))
+        queue.fill(first, None)
+        await queue.join()
+        await queue.stop()
+        return done, queue.metrics()
+
+    done, metrics = asyncio.run(main())
+
+    assert done == ["second", "after"]
+    assert metrics["pending"] == metrics["keys"] == metrics["parked"] == 0
@@ -0,0 +1,39 @@
+import asyncio
+import os
+
+from services import voice_engine
+from services.tts_providers import StubProvider, TTSRouter
+from services.voice_engine import cleanup_voice, text_to_voice
+
+
+def test_follower_synthesizes_when_the_leader_file_is_gone(monkeypatch):
+    stub = StubProvider(delay=0.05)
+    monkeypatch.setattr(voice_engine, "tts_router", TTSRouter([stub]))
+    # The cache is failing, so nothing can be served from it
+    monkeypatch.setattr(voice_engine.tts_cache, "get", lambda key: None)
+    monkeypatch.setattr(voice_engine.tts_cache, "put", lambda key, path: None)
+
+    synthesize = voice_engine._synthesize
+    leader_paths = []
+
+    async def leader_sends_and_deletes(*args, **kwargs):
+        result = await synthesize(*args, **kwargs)
+        if not leader_paths:
+            # The leader's send and cleanup win the race with the follower
+            leader_paths.append(result.path)
+            os.remove(result.path)
+        return result
+
+    monkeypatch.setattr(voice_engine, "_synthesize", leader_sends_and_deletes)
+
+    async def main():
+        return await asyncio.gather(
+            text_to_voice("hello", "m"), text_to_voice("hello", "m")
+        )
+
+    leader, follower = asyncio.run(main())
+
+    assert stub.calls == 2
+    assert leader.path == leader_paths[0]
+    assert follower.path != leader.path and os.path.getsize(follower.path) > 0
+    asyncio.run(cleanup_voice(follower))
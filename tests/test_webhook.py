@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+
+from middlewares.media_group import MediaGroupMiddleware
+from update_queue import UpdateQueue
+from webhook import SECRET_HEADER, WebhookServer
+
+from fake_bot_api import TOKEN
+
+SECRET = "test-secret"
+
+# As received from Telegram
+RECORDED_UPDATE = {
+    "update_id": 100,
+    "message": {
+        "message_id": 7,
+        "date": 1760000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Anna"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Anna"},
+        "text": "hello",
+    },
+}
+
+
+def _update(update_id: int, user_id: int = 42) -> dict:
+    update = {**RECORDED_UPDATE, "update_id": update_id}
+    update["message"] = {
+        **RECORDED_UPDATE["message"],
+        "chat": {"id": user_id, "type": "private", "first_name": "Anna"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Anna"},
+    }
+    return update
+
+
+def _album_part(update_id: int, group: str, user_id: int = 42) -> dict:
+    update = _update(update_id, user_id)
+    message = {**update["message"], "message_id": update_id, "media_group_id": group}
+    del message["text"]
+    message["photo"] = [
+        {
+            "file_id": f"p{update_id}",
+            "file_unique_id": f"u{update_id}",
+            "width": 1,
+            "height": 1,
+        }
+    ]
+    return {**update, "message": message}
+
+
+async def _with_client(check, max_pending: int = 100):
+    dp = Dispatcher()
+    release = asyncio.Event()
+    release.set()
+    seen = []
+
+    @dp.message()
+    async def on_message(message: Message, album: list = None):
+        await release.wait()
+        seen.append(f"album of {len(album)}" if album else message.text)
+
+    queue = UpdateQueue(workers=1, max_pending=max_pending)
+    albums = MediaGroupMiddleware(latency=0.1)
+    server = WebhookServer(dp, Bot(TOKEN), secret=SECRET, queue=queue, albums=albums)
+    client = TestClient(TestServer(server.app))
+    await client.start_server()
+    try:
+        await check(client, server, release, seen)
+    finally:
+        release.set()
+        await queue.stop()
+        await client.close()
+        await server.bot.session.close()
+
+
+def _post(client, body, secret=SECRET, **kwargs):
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return client.post("/webhook", json=body, headers=headers, **kwargs)
+
+
+def test_rejects_missing_or_wrong_secret():
+    async def check(client, server, release, seen):
+        assert (await _post(client, RECORDED_UPDATE, secret=None)).status == 401
+        assert (await _post(client, RECORDED_UPDATE, secret="wrong")).status == 401
+        await server.queue.join()
+        assert seen == [] and server.received == 0
+
+    asyncio.run(_with_client(check))
+
+
+def test_rejects_malformed_json():
+    async def check(client, server, release, seen):
+        response = await client.post(
+            "/webhook", data="{not json", headers={SECRET_HEADER: SECRET}
+        )
+        assert response.status == 400
+
+    asyncio.run(_with_client(check))
+
+
+def test_accepts_recorded_update_and_processes_it():
+    async def check(client, server, release, seen):
+        assert (await _post(client, RECORDED_UPDATE)).status == 200
+        await server.queue.join()
+        assert seen == ["hello"]
+        assert server.metrics()["processed"] == 1
+
+    asyncio.run(_with_client(check))
+
+
+def test_full_queue_answers_503():
+    async def check(client, server, release, seen):
+        release.clear()
+        # The worker picks this one up and blocks in the handler
+        assert (await _post(client, _update(1, user_id=1))).status == 200
+        while not server.queue.busy:
+            await asyncio.sleep(0.01)
+        assert (await _post(client, _update(2, user_id=2))).status == 200
+        assert (await _post(client, _update(3, user_id=3))).status == 503
+        assert server.metrics()["rejected"] == 1
+        release.set()
+        await server.queue.join()
+        assert len(seen) == 2
+
+    asyncio.run(_with_client(check, max_pending=1))
+
+
+def test_albums_are_collected_without_holding_a_worker():
+    async def check(client, server, release, seen):
+        for update_id in (1, 2, 3):
+            await _post(client, _album_part(update_id, "a", user_id=1))
+            await _post(client, _album_part(10 + update_id, "b", user_id=2))
+        # The only worker is free for other users while both albums collect
+        await _post(client, _update(20, user_id=3))
+        while not seen:
+            await asyncio.sleep(0.01)
+        assert seen == ["hello"]
+        await server.queue.join()
+        assert seen == ["hello", "album of 3", "album of 3"]
+        assert server.metrics()["processed"] == 3
+
+    asyncio.run(_with_client(check))
+
+
+def test_later_updates_of_a_user_wait_for_the_album():
+    async def check(client, server, release, seen):
+        await _post(client, _album_part(1, "a"))
+        await _post(client, _album_part(2, "a"))
+        await _post(client, _update(3))
+        await server.queue.join()
+        assert seen == ["album of 2", "hello"]
+
+    asyncio.run(_with_client(check))
+
+
+def test_server_requires_a_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(Dispatcher(), None, secret="")